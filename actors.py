@@ -0,0 +1,212 @@
+import queue
+import numpy as np
+import torch
+import torch.multiprocessing as mp
+from agent import MAX_MEMORY, BATCH_SIZE, LR, EPSILON_GAMES, MODEL_FILE
+from checkpoint import AsyncWriter, copy_state_dict, save_state_dict
+from environment import Environment
+from model import LinearQNet, QTrainer
+from memory import ReplayBuffer
+from observation import STATE_SIZE, encode_state
+from plotting import Plotter
+from metrics import Metrics, LOG_INTERVAL
+from performance import PerfConfig, actor_cpus, learner_cpus, pin
+
+N_WORKERS = max(1, mp.cpu_count() - 1)
+SYNC_INTERVAL = 100  # learner updates between publishing weights, and actor steps between checking for them
+CHUNK_SIZE = 256  # transitions sent to the learner at once
+QUEUE_SIZE = 64
+
+
+# Actor process: plays headless games with its own copy of the network and streams transitions to
+# the learner in chunks. Tensors put on a torch.multiprocessing queue travel through shared memory.
+def actor(worker_id, shared_net, version, lock, transitions, stop, sync_interval, chunk_size, seed, cpus=None,
+          act_threads=None):
+    torch.set_num_threads(act_threads or 1)
+    if cpus is not None:
+        pin(cpus)
+    torch.manual_seed(seed)
+
+    # only what playing needs: the game, a copy of the network and the exploration RNG
+    env = Environment(render=False, seed=seed)
+    net = LinearQNet(11, 256, 3)
+    rng = np.random.default_rng(seed)
+    n_games = 0
+    local_version = -1
+
+    states = np.zeros((chunk_size, STATE_SIZE), dtype=np.uint8)
+    actions = np.zeros(chunk_size, dtype=np.uint8)
+    rewards = np.zeros(chunk_size, dtype=np.float32)
+    next_states = np.zeros((chunk_size, STATE_SIZE), dtype=np.uint8)
+    dones = np.zeros(chunk_size, dtype=np.bool_)
+    scores = []
+    n = 0
+    steps = 0
+
+    state = encode_state(env)
+    while not stop.is_set():
+        if steps % sync_interval == 0 and version.value != local_version:
+            with lock:
+                local_version = version.value
+                net.load_state_dict(shared_net.state_dict())
+        steps += 1
+
+        # random moves while the first games are played, like Agent.get_action
+        epsilon = EPSILON_GAMES - n_games
+        if epsilon > 0 and rng.integers(0, 201) < epsilon:
+            action = int(rng.integers(0, 3))
+        else:
+            with torch.inference_mode():
+                action = int(torch.argmax(net(torch.as_tensor(state, dtype=torch.float))))
+        reward, done = env.change_all(action)
+
+        states[n] = state
+        actions[n] = action
+        rewards[n] = reward
+        encode_state(env, next_states[n])
+        dones[n] = done
+        state = next_states[n]
+        n += 1
+
+        if done:
+            n_games += 1
+            scores.append(env.score)
+            env.reset()
+            state = encode_state(env)
+
+        if n == chunk_size:
+            chunk = tuple(torch.from_numpy(x.copy()) for x in (states, actions, rewards, next_states, dones))
+            while not stop.is_set():
+                try:
+                    transitions.put((worker_id, chunk, scores), timeout=0.1)
+                    break
+                except queue.Full:
+                    pass
+            scores = []
+            n = 0
+
+
+# Learner: owns the replay memory and QTrainer, trains on minibatches while the actors play and
+# periodically publishes its weights to the shared network the actors copy from.
+class Learner:
+    def __init__(self, n_workers=N_WORKERS, sync_interval=SYNC_INTERVAL, chunk_size=CHUNK_SIZE, plot=True,
+                 verbose=True, save_model=True, metrics_file=None, log_file=None, log_interval=LOG_INTERVAL,
+                 seed=0, perf=None):
+        self.n_workers = n_workers
+        self.sync_interval = sync_interval
+        self.chunk_size = chunk_size
+        # live plot and/or CSV score log, both handled by a background process
+        self.plotter = None
+        if plot or metrics_file is not None:
+            self.plotter = Plotter(gui=plot, file_name=metrics_file)
+        self.verbose = verbose
+        self.save_model = save_model
+        self.writer = AsyncWriter()  # record models are written by a background thread
+        self.metrics = Metrics(log_file, log_interval)
+        self.seed = seed
+        # the learner only trains on batches, so it runs with the learning thread count throughout, acting
+        # happens in the actors with act_threads each
+        self.perf = perf if perf is not None else PerfConfig()
+        threads = torch.get_num_threads()
+        self.perf.apply()
+        torch.set_num_threads(self.perf.learn_threads or threads)
+
+        self.gamma = 0.9  # discount rate
+        self.memory = ReplayBuffer(MAX_MEMORY, STATE_SIZE)
+        self.net = LinearQNet(11, 256, 3)
+        self.trainer = QTrainer(self.net, lr=LR, gamma=self.gamma)
+        self.n_updates = 0
+
+        self.n_games = 0
+        self.plot_scores = []
+        self.plot_mean_scores = []
+        self.total_score = 0
+        self.mean_score = 0
+        self.record = 0
+
+    def train(self, max_games=None):
+        ctx = mp.get_context('spawn')
+        shared_net = LinearQNet(11, 256, 3)
+        shared_net.load_state_dict(self.net.state_dict())
+        shared_net.share_memory()
+        version = ctx.Value('i', 0)
+        lock = ctx.Lock()
+        transitions = ctx.Queue(maxsize=QUEUE_SIZE)
+        stop = ctx.Event()
+
+        pinned = self.perf.pin_actors
+        if pinned:
+            pin(learner_cpus(self.n_workers))
+        workers = [ctx.Process(target=actor, daemon=True,
+                               args=(i, shared_net, version, lock, transitions, stop, self.sync_interval,
+                                     self.chunk_size, self.seed + i + 1,
+                                     actor_cpus(i, self.n_workers) if pinned else None, self.perf.act_threads))
+                   for i in range(self.n_workers)]
+        for worker in workers:
+            worker.start()
+
+        try:
+            metrics = self.metrics
+            while max_games is None or self.n_games < max_games:
+                with metrics.time('receive'):
+                    self.receive(transitions)
+
+                if len(self.memory) > 0:
+                    with metrics.time('train_long_memory'):
+                        states, actions, rewards, next_states, dones = self.memory.sample(BATCH_SIZE)
+                        self.trainer.train_step(states, actions, rewards, next_states, dones)
+                    self.n_updates += 1
+
+                    if self.n_updates % self.sync_interval == 0:
+                        with lock:
+                            shared_net.load_state_dict(self.net.state_dict())
+                            version.value += 1
+
+                if metrics.due():
+                    metrics.periodic(games=self.n_games, replay_size=len(self.memory), loss=self.trainer.loss,
+                                     updates=self.n_updates)
+        finally:
+            stop.set()
+            # keep draining so no actor stays blocked on a full queue, chunks of exited actors are lost
+            while any(worker.is_alive() for worker in workers):
+                try:
+                    transitions.get(timeout=0.1)
+                except (queue.Empty, OSError):
+                    pass
+            for worker in workers:
+                worker.join()
+            self.writer.flush()
+
+    def receive(self, transitions):
+        # block only while there is nothing to train on yet, take at most a few chunks per worker
+        block = len(self.memory) == 0
+        for _ in range(4 * self.n_workers):
+            try:
+                worker_id, chunk, scores = transitions.get(block=block, timeout=1 if block else None)
+            except queue.Empty:
+                if block:
+                    continue
+                return
+            block = False
+            self.memory.push_batch(*(x.numpy() for x in chunk))
+            self.metrics.step(len(chunk[0]))
+            for score in scores:
+                self.end_game(score)
+
+    def end_game(self, score):
+        self.n_games += 1
+        if self.record < score:
+            self.record = score
+            if self.save_model:
+                self.writer.submit(save_state_dict, copy_state_dict(self.net.state_dict()), MODEL_FILE)
+
+        if self.verbose:
+            print('Game', self.n_games, 'Score', score, 'Record:', self.record)
+        self.metrics.game(game=self.n_games, score=score, record=self.record, loss=self.trainer.loss)
+
+        self.plot_scores.append(score)
+        self.total_score += score
+        self.mean_score = self.total_score / self.n_games
+        self.plot_mean_scores.append(self.mean_score)
+        if self.plotter is not None:
+            self.plotter.add(score, self.mean_score)
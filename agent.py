@@ -1,25 +1,135 @@
+import argparse
+import copy
+import os
 import torch
-import random
 import numpy as np
-from collections import deque
-from environment import Environment, Direction, Point
-from model import LinearQNet, QTrainer
-from statistics import plot
+from environment import Environment
+from observation import STATE_SIZE, encode_state, GridObservation
+from model import LinearQNet, ConvQNet, QTrainer
+from memory import ReplayBuffer, PrioritizedReplayBuffer, MappedReplayBuffer, NStepWindow
+from plotting import Plotter
+from metrics import Metrics, LOG_INTERVAL
+from checkpoint import AsyncWriter, copy_state_dict, save_state_dict, read_checkpoint
+from dataset import TransitionRecorder, train_offline
+from performance import PerfConfig
+from traces import TraceWriter
 
 MAX_MEMORY = 100_000
+GRID_MEMORY = 20_000  # grid observations are ~3.5 KB each instead of 11 bytes
 BATCH_SIZE = 1000
 LR = 0.001
+GAMMA = 0.9
+HIDDEN_SIZE = 256
+EPSILON_GAMES = 80  # games with random moves, fewer and fewer of them
+CHECKPOINT_EVERY = 100  # games
+PRETRAIN_EPOCHS = 3
+PRETRAIN_MARGIN = 1.0  # large-margin imitation loss for planner games
+MODEL_FILE = './model/model.pth'
+
+
+# When the agent trains. The original schedule ('classic') is one update on the newest transition every step
+# (short_memory) and game_batches replay batches after every game. Replay batches can also be trained every
+# train_every steps, updates_per_step * train_every of them (fractions carry over), once the replay memory holds
+# warmup transitions.
+class UpdateSchedule:
+    def __init__(self, short_memory=True, game_batches=1, train_every=0, updates_per_step=1.0,
+                 batch_size=BATCH_SIZE, warmup=0):
+        self.short_memory = short_memory
+        self.game_batches = game_batches
+        self.train_every = train_every
+        self.updates_per_step = updates_per_step
+        self.batch_size = batch_size
+        self.warmup = warmup
+
+    def replace(self, **changes):
+        # copy with some fields changed, None values are ignored
+        fields = dict(vars(self))
+        fields.update((name, value) for name, value in changes.items() if value is not None)
+        return UpdateSchedule(**fields)
+
+
+SCHEDULES = {
+    'classic': UpdateSchedule(),
+    # minibatches from replay only, one batch of 64 every 4 steps
+    'batched': UpdateSchedule(short_memory=False, game_batches=0, train_every=4, updates_per_step=0.25,
+                              batch_size=64, warmup=1000),
+}
 
 
 class Agent:
-    def __init__(self):
+    def __init__(self, render=True, render_every=0, prioritized=False, plot=True, verbose=True,
+                 save_model=True, metrics_file=None, log_file=None, log_interval=LOG_INTERVAL, seed=None,
+                 checkpoint_dir=None, checkpoint_every=CHECKPOINT_EVERY, replay_capacity=None, replay_file=None,
+                 record_dir=None, target_sync=0, tau=1.0, double=False, schedule='classic', perf=None,
+                 observation='features', lr=LR, gamma=GAMMA, hidden_size=HIDDEN_SIZE, epsilon_games=EPSILON_GAMES,
+                 trace_file=None, n_step=1):
         self.n_games = 0
         self.epsilon = 0  # randomness
-        self.gamma = 0.9  # discount rate
-        self.memory = deque(maxlen=MAX_MEMORY)  # popleft()
-        self.net = LinearQNet(11, 256, 3)
-        self.trainer = QTrainer(self.net, lr=LR, gamma=self.gamma)
-        self.env = Environment()
+        self.gamma = gamma  # discount rate
+        self.epsilon_games = epsilon_games
+        self.rng = np.random.default_rng(seed)
+        self.schedule = SCHEDULES[schedule] if isinstance(schedule, str) else schedule
+        self.update_credit = 0.0  # replay updates owed by the schedule
+        self.render = render
+        self.render_every = render_every  # show every n-th game even when headless, 0 = never
+        self.env = Environment(render=render, seed=seed)
+
+        # the 11 features, or the board as planes (observation.GridObservation) for a convolutional network
+        self.grid_obs = None
+        self.state_shape = (STATE_SIZE,)
+        if observation == 'grid':
+            self.grid_obs = GridObservation(self.env.fieldW, self.env.fieldH)
+            self.state_shape = self.grid_obs.shape
+        elif observation != 'features':
+            raise ValueError('unknown observation {!r}, expected features or grid'.format(observation))
+        state_size = self.state_shape if self.grid_obs is not None else STATE_SIZE
+        if replay_capacity is None:
+            replay_capacity = GRID_MEMORY if self.grid_obs is not None else MAX_MEMORY
+
+        self.prioritized = prioritized
+        # replay holds n-step returns with their bootstrap discounts when n_step > 1, short memory stays 1-step
+        self.n_step = n_step
+        discounts = n_step > 1
+        if replay_file is not None:
+            if prioritized or discounts:
+                raise ValueError('prioritized replay and n-step returns are not supported with a replay file')
+            self.memory = MappedReplayBuffer(replay_file, replay_capacity, state_size)  # reopened if it exists
+        elif prioritized:
+            self.memory = PrioritizedReplayBuffer(replay_capacity, state_size, discounts=discounts)
+        else:
+            self.memory = ReplayBuffer(replay_capacity, state_size, discounts=discounts)  # overwrites the oldest
+        self.window = NStepWindow(n_step, self.gamma, state_size) if discounts else None
+        # torch thread counts and compilation, torch defaults unless given
+        self.perf = perf if perf is not None else PerfConfig()
+        self.perf.apply()
+        if self.grid_obs is not None:
+            self.net = ConvQNet(*self.state_shape, 3)
+        else:
+            self.net = LinearQNet(11, hidden_size, 3)
+        self.model = self.perf.compile_model(self.net)  # what acting and training run, the net is what is saved
+        self.trainer = QTrainer(self.model, lr=lr, gamma=self.gamma, target_sync=target_sync, tau=tau, double=double)
+        # live plot and/or CSV score log, both handled by a background process
+        self.plotter = None
+        if plot or metrics_file is not None:
+            self.plotter = Plotter(gui=plot, file_name=metrics_file)
+        self.verbose = verbose
+        self.save_model = save_model  # save the network on every new record
+        self.metrics = Metrics(log_file, log_interval)
+        # model and checkpoint files are written by a background thread
+        self.writer = AsyncWriter()
+        self.checkpoint_dir = checkpoint_dir
+        self.checkpoint_every = checkpoint_every
+        # every transition is also streamed to disk when recording, the recorder continues the game ids already
+        # in its folder and gets game numbers counted from record_base, the n_games its recording started at
+        self.recorder = None
+        self.record_base = 0
+        if record_dir is not None:
+            self.recorder = TransitionRecorder(record_dir, state_size=state_size, writer=self.writer)
+        # seed and actions of every game, to play any of them again with traces.py, game n_games is traced as
+        # tracer.first_game + n_games - 1
+        self.tracer = None
+        if trace_file is not None:
+            self.tracer = TraceWriter(trace_file, self.env.fieldW, self.env.fieldH)
 
         self.plot_scores = []
         self.plot_mean_scores = []
@@ -28,122 +138,366 @@ class Agent:
         self.record = 0
 
     def remember(self, state, action, reward, next_state, done):
-        self.memory.append((state, action, reward, next_state, done))  # popleft if MAX_MEMORY is reached
-
-    def train_long_memory(self):
-        if len(self.memory) > BATCH_SIZE:
-            mini_sample = random.sample(self.memory, BATCH_SIZE)  # list of tuples
+        if self.window is not None:
+            self.window.push(self.memory, state, action, reward, next_state, done)
         else:
-            mini_sample = self.memory
+            self.memory.push(state, action, reward, next_state, done)
 
-        states, actions, rewards, next_states, dones = zip(*mini_sample)
-        self.trainer.train_step(states, actions, rewards, next_states, dones)
-        # for state, action, reward, next_state, done in mini_sample:
-        #    self.trainer.train_step(state, action, reward, next_state, done)
+    def train_long_memory(self, batch_size=BATCH_SIZE):
+        batch = self.memory.sample(batch_size)
+        discounts = batch[5] if self.window is not None else None
+        if self.prioritized:
+            weights, idx = batch[-2:]
+            td_errors = self.trainer.train_step(*batch[:5], weights=weights, discount=discounts)
+            self.memory.update_priorities(idx, td_errors)
+        else:
+            self.trainer.train_step(*batch[:5], discount=discounts)
 
     def train_short_memory(self, state, action, reward, next_state, done):
         self.trainer.train_step(state, action, reward, next_state, done)
 
-    def get_state(self):
-        snake = self.env.snake
-        food = self.env.food.pt
-        point_l = Point(snake.head.x - 20, snake.head.y)
-        point_r = Point(snake.head.x + 20, snake.head.y)
-        point_u = Point(snake.head.x, snake.head.y - 20)
-        point_d = Point(snake.head.x, snake.head.y + 20)
-
-        dir_l = snake.direction == Direction.LEFT
-        dir_r = snake.direction == Direction.RIGHT
-        dir_u = snake.direction == Direction.UP
-        dir_d = snake.direction == Direction.DOWN
-
-        state = [
-            # Danger straight
-            (dir_r and snake.is_collide_with_something([point_r])) or
-            (dir_l and snake.is_collide_with_something([point_l])) or
-            (dir_u and snake.is_collide_with_something([point_u])) or
-            (dir_d and snake.is_collide_with_something([point_d])),
-
-            # Danger right
-            (dir_u and snake.is_collide_with_something([point_r])) or
-            (dir_d and snake.is_collide_with_something([point_l])) or
-            (dir_l and snake.is_collide_with_something([point_u])) or
-            (dir_r and snake.is_collide_with_something([point_d])),
-
-            # Danger left
-            (dir_d and snake.is_collide_with_something([point_r])) or
-            (dir_u and snake.is_collide_with_something([point_l])) or
-            (dir_r and snake.is_collide_with_something([point_u])) or
-            (dir_l and snake.is_collide_with_something([point_d])),
-
-            # Move direction
-            dir_l,
-            dir_r,
-            dir_u,
-            dir_d,
-
-            # Food location
-            food.x < snake.head.x,  # food left
-            food.x > snake.head.x,  # food right
-            food.y < snake.head.y,  # food up
-            food.y > snake.head.y  # food down
-        ]
-
-        return np.array(state, dtype=int)
+    def get_state(self, out=None):
+        # writes into out when given instead of allocating a new array
+        if self.grid_obs is not None:
+            return self.grid_obs.encode(self.env, out)
+        return encode_state(self.env, out)
 
     def get_action(self, state):
         # random moves: tradeoff exploration / exploitation
-        self.epsilon = 80 - self.n_games
-        action = [0, 0, 0]
-        if random.randint(0, 200) < self.epsilon:
-            move = random.randint(0, 2)
-            action[move] = 1
-        else:
-            state0 = torch.tensor(state, dtype=torch.float)
-            prediction = self.net(state0)
-            move = torch.argmax(prediction).item()
-            action[move] = 1
+        self.epsilon = self.epsilon_games - self.n_games
+        if self.epsilon > 0 and self.rng.integers(0, 201) < self.epsilon:
+            return int(self.rng.integers(0, 3))
+
+        with torch.inference_mode():
+            prediction = self.model(torch.as_tensor(state, dtype=torch.float))
+        return int(torch.argmax(prediction))
+
+    def get_actions(self, states):
+        # batched get_action: (n, 11) states -> (n,) action indices, one forward pass for the whole batch
+        self.epsilon = self.epsilon_games - self.n_games
+        explore = self.rng.integers(0, 201, size=len(states)) < self.epsilon
+        if explore.all():
+            return self.rng.integers(0, 3, size=len(states))
+
+        with torch.inference_mode():
+            prediction = self.model(torch.as_tensor(states, dtype=torch.float))
+        moves = torch.argmax(prediction, dim=1).numpy()
+        moves[explore] = self.rng.integers(0, 3, size=int(explore.sum()))
+        return moves
+
+    def is_render_game(self):
+        if self.render:
+            return True
+        return self.render_every > 0 and self.n_games % self.render_every == 0
+
+    def save_checkpoint(self):
+        # Snapshot of everything training depends on, taken here between games and written to
+        # checkpoint_dir/game-NNNNNNN by the writer thread. Skipped while the previous one is still being written.
+        if self.writer.checkpoint_pending.is_set():
+            return False
+        arrays, replay = self.memory.snapshot()
+        files = {'replay-{}.npy'.format(name): array for name, array in arrays.items()}
+        files['net.pt'] = copy_state_dict(self.net.state_dict())
+        files['optimizer.pt'] = copy.deepcopy(self.trainer.optimizer.state_dict())
+        if self.trainer.target_model is not None:
+            files['target.pt'] = copy_state_dict(self.trainer.target_model.state_dict())
+        files['state.pkl'] = {
+            'n_games': self.n_games,
+            'record': self.record,
+            'total_score': self.total_score,
+            'updates': self.trainer.updates,
+            'update_credit': self.update_credit,
+            'plot_scores': list(self.plot_scores),
+            'plot_mean_scores': list(self.plot_mean_scores),
+            'replay': replay,
+            'rng': self.rng.bit_generator.state,
+            'env_rng': self.env.seeds.getstate(),  # seeds of the next games
+            'trace': None if self.tracer is None else (os.path.abspath(self.tracer.file.name), self.tracer.first_game),
+            'numpy_rng': np.random.get_state(),
+            'torch_rng': torch.get_rng_state(),
+        }
+        return self.writer.save_checkpoint(self.checkpoint_dir, 'game-{:07d}'.format(self.n_games), files)
+
+    def load_checkpoint(self, folder, name=None):
+        # continues from the latest checkpoint in folder (or the one called name) as if never stopped
+        files = read_checkpoint(folder, name)
+        state = files['state.pkl']
+        self.net.load_state_dict(files['net.pt'])
+        self.trainer.optimizer.load_state_dict(files['optimizer.pt'])
+        if self.trainer.target_model is not None:
+            # a checkpoint without a target network starts it from the saved network
+            self.trainer.target_model.load_state_dict(files.get('target.pt', files['net.pt']))
+        self.trainer.updates = state.get('updates', 0)
+        self.update_credit = state.get('update_credit', 0.0)
+        arrays = {file_name[len('replay-'):-len('.npy')]: array
+                  for file_name, array in files.items() if file_name.startswith('replay-')}
+        self.memory.restore(arrays, state['replay'])
 
-        return action
+        self.n_games = state['n_games']
+        self.record_base = self.n_games
+        if self.tracer is not None:
+            trace = state.get('trace')
+            if trace is not None and trace[0] == os.path.abspath(self.tracer.file.name):
+                # games played after the checkpoint are played again, under the same numbers
+                self.tracer.first_game = trace[1]
+                self.tracer.truncate(self.tracer.first_game + self.n_games)
+            else:
+                self.tracer.first_game -= self.n_games  # the next game goes after the last one in the file
+        self.record = state['record']
+        self.total_score = state['total_score']
+        self.plot_scores = state['plot_scores']
+        self.plot_mean_scores = state['plot_mean_scores']
+        self.mean_score = self.plot_mean_scores[-1] if self.plot_mean_scores else 0
+        self.rng.bit_generator.state = state['rng']
+        if 'env_rng' in state:
+            self.env.seeds.setstate(state['env_rng'])
+        np.random.set_state(state['numpy_rng'])
+        torch.set_rng_state(state['torch_rng'])
+        if self.plotter is not None:
+            self.plotter.add_history(self.plot_scores, self.plot_mean_scores)
 
-    def train(self):
-        while True:
-            # get old state
-            state_old = self.get_state()
+        # the checkpoint was taken before the reset that starts the next game
+        self.env.reset()
+        self.env.set_render(self.is_render_game())
 
+    def pretrain(self, folders, epochs=PRETRAIN_EPOCHS, batch_size=BATCH_SIZE, margin=PRETRAIN_MARGIN, seed=None):
+        # fits the network on recorded games (e.g. planner.py --record) before train(), returns the updates
+        if self.grid_obs is not None:
+            raise ValueError('pretraining needs the features observation the recordings have')
+        with self.perf.learning():
+            updates = train_offline(self.trainer, folders, epochs, batch_size, seed, margin)
+        if self.trainer.target_model is not None:
+            self.trainer.target_model.load_state_dict(self.net.state_dict())
+        return updates
+
+    def train(self, max_games=None, stop=None):
+        # runs until max_games are played or stop(agent) returns True after a game, forever by default
+        metrics = self.metrics
+        schedule = self.schedule
+        game_start = metrics.env_steps
+
+        # the new state of one step is the old state of the next, so two buffers are swapped around
+        state_old = np.zeros(self.state_shape, dtype=np.uint8)
+        state_new = np.zeros(self.state_shape, dtype=np.uint8)
+        self.get_state(state_old)
+        while max_games is None or self.n_games < max_games:
             # get move
-            action_old = self.get_action(state_old)
+            with metrics.time('get_action'):
+                action_old = self.get_action(state_old)
 
             # perform move and get new state
-            reward, done = self.env.change_all(action_old)
-            state_new = self.get_state()
+            with metrics.time('change_all'):
+                reward, done = self.env.change_all(action_old)
+            with metrics.time('get_state'):
+                self.get_state(state_new)
+            metrics.step()
 
             # train short memory
-            self.train_short_memory(state_old, action_old, reward, state_new, done)
+            if schedule.short_memory:
+                with metrics.time('train_short_memory'):
+                    self.train_short_memory(state_old, action_old, reward, state_new, done)
 
             # remember
-            self.remember(state_old, action_old, reward, state_new, done)
+            with metrics.time('remember'):
+                self.remember(state_old, action_old, reward, state_new, done)
+            if self.recorder is not None:
+                with metrics.time('record'):
+                    self.recorder.add(state_old, action_old, reward, state_new, done,
+                                      self.n_games - self.record_base, metrics.env_steps - game_start - 1)
+            if self.tracer is not None:
+                self.tracer.add(action_old)
+
+            # train on replay batches every few steps
+            if (schedule.train_every and metrics.env_steps % schedule.train_every == 0
+                    and len(self.memory) >= schedule.warmup):
+                self.update_credit += schedule.train_every * schedule.updates_per_step
+                while self.update_credit >= 1:
+                    self.update_credit -= 1
+                    with metrics.time('train_replay'), self.perf.learning():
+                        self.train_long_memory(schedule.batch_size)
+
+            if metrics.due():
+                metrics.periodic(games=self.n_games, replay_size=len(self.memory), epsilon=self.epsilon,
+                                 loss=self.trainer.loss)
 
             if done:
                 # train long memory, plot result
                 self.n_games += 1
-                self.train_long_memory()
+                if len(self.memory) >= schedule.warmup:
+                    for _ in range(schedule.game_batches):
+                        with metrics.time('train_long_memory'), self.perf.learning():
+                            self.train_long_memory(schedule.batch_size)
 
                 if self.env.score > self.record:
                     self.record = self.env.score
-                    self.net.save()
+                    if self.save_model:
+                        self.writer.submit(save_state_dict, copy_state_dict(self.net.state_dict()), MODEL_FILE)
+
+                trace = ()
+                if self.tracer is not None:
+                    trace = ('Trace', self.tracer.end_game(self.n_games - 1, self.env.game_seed, self.env.score))
+                if self.verbose:
+                    print('Game', self.n_games, 'Score', self.env.score, 'Record:', self.record, *trace)
 
-                print('Game', self.n_games, 'Score', self.env.score, 'Record:', self.record)
+                metrics.game(game=self.n_games, score=self.env.score, record=self.record,
+                             steps=metrics.env_steps - game_start, epsilon=self.epsilon, loss=self.trainer.loss)
+                game_start = metrics.env_steps
 
                 self.plot_scores.append(self.env.score)
                 self.total_score += self.env.score
                 self.mean_score = self.total_score / self.n_games
                 self.plot_mean_scores.append(self.mean_score)
-                plot(self.plot_scores, self.plot_mean_scores)
+                if self.plotter is not None:
+                    self.plotter.add(self.env.score, self.mean_score)
+                if self.checkpoint_dir is not None and self.n_games % self.checkpoint_every == 0:
+                    with metrics.time('checkpoint'):
+                        self.save_checkpoint()
                 self.env.reset()
+                self.env.set_render(self.is_render_game())
+                self.get_state(state_new)
 
+                if stop is not None and stop(self):
+                    break
 
-if __name__ == '__main__':
-    agent = Agent()
+            state_old, state_new = state_new, state_old
+
+        if self.recorder is not None:
+            self.recorder.flush()
+        if self.tracer is not None:
+            self.tracer.flush()
+        self.writer.flush()
+
+
+# options of the single process Agent that the --workers Learner does not have
+WORKER_UNSUPPORTED = ('render_every', 'prioritized', 'lr', 'gamma', 'hidden_size', 'epsilon_games', 'schedule',
+                      'train_every', 'updates_per_step', 'batch_size', 'warmup', 'compile', 'target_sync', 'tau',
+                      'double', 'replay_capacity', 'replay_file')
+
+
+def parse_args(args=None):
+    parser = argparse.ArgumentParser(description='Train the snake agent')
+    parser.add_argument('--headless', action='store_true', help='do not render or throttle the games')
+    parser.add_argument('--render-every', type=int, default=0, help='when headless, still render every n-th game')
+    parser.add_argument('--no-plot', action='store_true', help='do not show the live score plot')
+    parser.add_argument('--metrics-file',
+                        help='append game,score,mean_score of every game to this CSV file (what the plot shows)')
+    parser.add_argument('--log-file',
+                        help='append JSON lines with per-game records plus throughput and phase timings every '
+                             '--log-interval seconds, for profiling')
+    parser.add_argument('--log-interval', type=float, default=LOG_INTERVAL,
+                        help='seconds between throughput records in the log file')
+    parser.add_argument('--prioritized', action='store_true', help='use prioritized experience replay')
+    parser.add_argument('--lr', type=float, default=LR, help='learning rate')
+    parser.add_argument('--gamma', type=float, default=GAMMA, help='discount rate')
+    parser.add_argument('--hidden-size', type=int, default=HIDDEN_SIZE, help='hidden units of LinearQNet')
+    parser.add_argument('--epsilon-games', type=int,
+                        help='exploration decays to nothing over this many games (default {}, 0 with '
+                             '--pretrain)'.format(EPSILON_GAMES))
+    parser.add_argument('--pretrain', metavar='DIR', nargs='+',
+                        help='first fit the network on games recorded in these folders, e.g. by planner.py')
+    parser.add_argument('--pretrain-epochs', type=int, default=PRETRAIN_EPOCHS)
+    parser.add_argument('--pretrain-margin', type=float, default=PRETRAIN_MARGIN,
+                        help='weight on imitating the recorded actions, 0 = plain offline Q-learning')
+    parser.add_argument('--schedule', choices=sorted(SCHEDULES), default='classic',
+                        help='when to train: classic = every step on the newest transition plus a replay batch '
+                             'after each game, batched = replay minibatches every few steps')
+    parser.add_argument('--train-every', type=int, help='steps between replay updates')
+    parser.add_argument('--updates-per-step', type=float, help='replay updates per environment step')
+    parser.add_argument('--batch-size', type=int, help='replay batch size')
+    parser.add_argument('--warmup', type=int, help='transitions in replay before training on it')
+    parser.add_argument('--perf-profile', help='thread settings saved by performance.py')
+    parser.add_argument('--act-threads', type=int, help='torch threads while playing and for single transitions '
+                                                          '(of each actor with --workers, default 1 there)')
+    parser.add_argument('--learn-threads', type=int, help='torch threads for replay batch updates')
+    parser.add_argument('--pin-actors', action='store_true', help='pin each --workers actor process to its own CPU')
+    parser.add_argument('--compile', action='store_true', help='run the network through torch.compile')
+    parser.add_argument('--target-sync', type=int, default=0,
+                        help='updates between target network syncs, 0 = bootstrap from the trained network itself')
+    parser.add_argument('--n-step', type=int, default=1,
+                        help='replay n-step returns, discounted rewards of n steps bootstrapped with gamma^n')
+    parser.add_argument('--tau', type=float, default=1.0, help='target sync weight, 1 = copy, below 1 = Polyak average')
+    parser.add_argument('--double', action='store_true', help='double DQN targets, needs --target-sync')
+    parser.add_argument('--observation', choices=('features', 'grid'), default='features',
+                        help='11 hand-made features with LinearQNet, or the board planes with ConvQNet')
+    parser.add_argument('--replay-capacity', type=int,
+                        help='transitions kept for replay (default {} or {} with --observation grid)'.format(
+                            MAX_MEMORY, GRID_MEMORY))
+    parser.add_argument('--replay-file', help='keep the replay memory in this memory-mapped file, reopened if there')
+    parser.add_argument('--record', metavar='DIR', help='also write every transition to compressed chunks in DIR')
+    parser.add_argument('--trace', metavar='FILE',
+                        help='append the seed and moves of every game to FILE, to watch any of them with traces.py')
+    parser.add_argument('--workers', type=int, default=0,
+                        help='play in this many headless actor processes feeding one learner, 0 = single process')
+    parser.add_argument('--sync-interval', type=int, default=100,
+                        help='learner updates between sending weights to the actors')
+    parser.add_argument('--checkpoint-dir', help='save the full training state to this folder every few games')
+    parser.add_argument('--checkpoint-every', type=int, default=CHECKPOINT_EVERY, help='games between checkpoints')
+    parser.add_argument('--resume', action='store_true', help='continue from the latest checkpoint in --checkpoint-dir')
+    args = parser.parse_args(args)
+    if args.replay_file is not None and (args.prioritized or args.n_step > 1):
+        parser.error('--replay-file does not support --prioritized or --n-step')
+    if args.n_step < 1:
+        parser.error('--n-step must be at least 1')
+    if args.workers > 0 and args.n_step > 1:
+        parser.error('--n-step is not supported with --workers')
+    if args.double and args.target_sync <= 0:
+        parser.error('--double needs --target-sync')
+    if args.tau != 1.0 and args.target_sync <= 0:
+        parser.error('--tau needs --target-sync')
+    if args.resume and args.checkpoint_dir is None:
+        parser.error('--resume needs --checkpoint-dir')
+    if args.workers > 0 and (args.checkpoint_dir is not None or args.record is not None or args.trace is not None):
+        parser.error('--checkpoint-dir, --record and --trace are not supported with --workers')
+    if args.workers > 0 and args.observation == 'grid':
+        parser.error('--observation grid is not supported with --workers')
+    if args.workers > 0:
+        # the Learner has its own fixed replay memory, network and update loop
+        given = ['--' + dest.replace('_', '-') for dest in WORKER_UNSUPPORTED
+                 if getattr(args, dest) != parser.get_default(dest)]
+        if given:
+            parser.error('{} not supported with --workers'.format(', '.join(given)))
+    if args.pretrain is not None and (args.observation == 'grid' or args.workers > 0 or args.resume):
+        parser.error('--pretrain is not supported with --observation grid, --workers or --resume')
+    if args.epsilon_games is None:
+        args.epsilon_games = 0 if args.pretrain is not None else EPSILON_GAMES
+    return args
+
+
+def main(args=None):
+    args = parse_args(args)
+    plot = not (args.headless or args.no_plot)
+    perf = PerfConfig.load(args.perf_profile) if args.perf_profile else PerfConfig()
+    perf = perf.replace(act_threads=args.act_threads, learn_threads=args.learn_threads,
+                        pin_actors=args.pin_actors or None, compile=args.compile or None)
+    if args.workers > 0:
+        from actors import Learner
+        learner = Learner(n_workers=args.workers, sync_interval=args.sync_interval, plot=plot,
+                          metrics_file=args.metrics_file, log_file=args.log_file, log_interval=args.log_interval,
+                          perf=perf)
+        learner.train()
+        if learner.plotter is not None:
+            learner.plotter.close()
+        return
+
+    schedule = SCHEDULES[args.schedule].replace(train_every=args.train_every, updates_per_step=args.updates_per_step,
+                                                batch_size=args.batch_size, warmup=args.warmup)
+    agent = Agent(render=not args.headless, render_every=args.render_every, prioritized=args.prioritized,
+                  plot=plot, metrics_file=args.metrics_file, log_file=args.log_file, log_interval=args.log_interval,
+                  checkpoint_dir=args.checkpoint_dir, checkpoint_every=args.checkpoint_every,
+                  replay_capacity=args.replay_capacity, replay_file=args.replay_file, record_dir=args.record,
+                  target_sync=args.target_sync, tau=args.tau, double=args.double, schedule=schedule, perf=perf,
+                  observation=args.observation, lr=args.lr, gamma=args.gamma, hidden_size=args.hidden_size,
+                  epsilon_games=args.epsilon_games, trace_file=args.trace, n_step=args.n_step)
+    if args.resume:
+        agent.load_checkpoint(args.checkpoint_dir)
+    if args.pretrain is not None:
+        updates = agent.pretrain(args.pretrain, args.pretrain_epochs, margin=args.pretrain_margin)
+        print('Pretrained', updates, 'updates, loss', agent.trainer.loss)
 
     agent.train()
+    if agent.plotter is not None:
+        agent.plotter.close()
+
+
+if __name__ == '__main__':
+    main()
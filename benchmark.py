@@ -0,0 +1,488 @@
+import argparse
+import json
+import platform
+import random
+import resource
+import os
+import subprocess
+import tempfile
+import time
+import numpy as np
+import torch
+from agent import Agent, SCHEDULES
+from environment import Environment, Snake, Direction, Point
+from memory import ReplayBuffer, PrioritizedReplayBuffer, MappedReplayBuffer
+from model import LinearQNet, ConvQNet, QTrainer
+from export import export
+from inference import load_policy
+from observation import STATE_SIZE, GridObservation
+from planner import generate
+from vector_environment import VectorEnvironment
+
+MIN_TIME = 0.5  # seconds each measurement runs for
+SNAKE_LENGTHS = (3, 50, 200, 500)
+FIELD_SIZES = ((640, 480), (1280, 960))  # window sizes in pixels, 20 pixel cells
+BATCH_SIZES = (1, 1000)
+N_ENVS = (1, 1024)
+TARGET_SYNC = 1000  # updates between hard target network copies
+TAU = 0.005  # Polyak weight when the target network follows every update
+N_STEPS = (1, 3, 5)
+PLANNER_GAMES = 20  # recorded for pretraining, about 50k transitions
+
+
+def seed_all(seed):
+    random.seed(seed)
+    np.random.seed(seed)
+    torch.manual_seed(seed)
+
+
+def ops_per_sec(fn, min_time=MIN_TIME):
+    fn()  # warm up
+    n = 0
+    start = time.perf_counter()
+    elapsed = 0
+    while elapsed < min_time:
+        fn()
+        n += 1
+        elapsed = time.perf_counter() - start
+    return n / elapsed
+
+
+def max_rss_kb():
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+
+def result(name, ops, **params):
+    record = {'name': name}
+    record.update(params)
+    record.update({'ops_per_sec': ops, 'max_rss_kb': max_rss_kb()})
+    return record
+
+
+def result_key(record):
+    params = sorted((k, v) for k, v in record.items()
+                    if k not in ('name', 'ops_per_sec', 'max_rss_kb', 'bytes', 'seconds', 'games', 'final_mean',
+                                 'latency_us', 'load_seconds', 'pretrain_seconds', 'mean_score', 'min_score',
+                                 'max_score', 'mean_game_length'))
+    return record['name'] + ''.join('.{}={}'.format(k, v) for k, v in params)
+
+
+def hamiltonian_cycle(w, h):
+    # row 0 left to right, snake through columns 1..w-1 of the other rows, back up column 0; h must be even
+    cycle = [Point(x, 0) for x in range(w)]
+    for y in range(1, h):
+        xs = range(w - 1, 0, -1) if y % 2 == 1 else range(1, w)
+        cycle.extend(Point(x, y) for x in xs)
+    cycle.extend(Point(0, y) for y in range(h - 1, 0, -1))
+    return cycle
+
+
+def cycle_actions(cycle):
+    # relative action that keeps a snake whose head is on cycle[i] following the cycle
+    clock_wise = [Direction.RIGHT, Direction.DOWN, Direction.LEFT, Direction.UP]
+    moves = {(1, 0): Direction.RIGHT, (0, 1): Direction.DOWN, (-1, 0): Direction.LEFT, (0, -1): Direction.UP}
+    n = len(cycle)
+    directions = [moves[(cycle[(i + 1) % n].x - cycle[i].x, cycle[(i + 1) % n].y - cycle[i].y)] for i in range(n)]
+    actions = []
+    for i in range(n):
+        turn = (clock_wise.index(directions[i]) - clock_wise.index(directions[i - 1])) % 4
+        actions.append([0, 1, None, 2][turn])
+    return actions, directions
+
+
+def long_snake_env(length, window_width=640, window_height=480):
+    # headless environment whose snake of the given length follows a Hamiltonian cycle forever,
+    # with the food out of reach so the length stays fixed
+    env = Environment(window_width, window_height, render=False)
+    cycle = hamiltonian_cycle(env.fieldW, env.fieldH)
+    actions, directions = cycle_actions(cycle)
+
+    snake = Snake(0, 0, env.fieldW, env.fieldH)
+    while snake.body:
+        snake.pop_tail()
+    for pt in cycle[:length]:
+        snake.push_head(pt)
+    snake.head = cycle[length - 1]
+    snake.direction = directions[length - 2]
+    env.snake = snake
+    env.food.pt = Point(-10, -10)
+    return env, actions, length - 1
+
+
+def bench_env(lengths=SNAKE_LENGTHS, sizes=FIELD_SIZES, min_time=MIN_TIME):
+    results = []
+    for width, height in sizes:
+        for length in lengths:
+            env, actions, pos = long_snake_env(length, width, height)
+            field = '{}x{}'.format(env.fieldW, env.fieldH)
+            n = len(actions)
+            step = [pos]
+
+            def change_all():
+                env.frame_iteration = 0
+                env.change_all(actions[step[0]])
+                step[0] = (step[0] + 1) % n
+
+            def move_collide_pop():
+                env.snake.move(actions[step[0]])
+                env.snake.is_collision(env.fieldW, env.fieldH)
+                env.snake.pop_tail()
+                step[0] = (step[0] + 1) % n
+
+            def is_collision():
+                env.snake.is_collision(env.fieldW, env.fieldH)
+
+            results.append(result('env.change_all', ops_per_sec(change_all, min_time), length=length, field=field))
+            results.append(result('snake.move', ops_per_sec(move_collide_pop, min_time), length=length, field=field))
+            results.append(result('snake.is_collision', ops_per_sec(is_collision, min_time), length=length,
+                                  field=field))
+    return results
+
+
+def bench_agent(lengths=SNAKE_LENGTHS, min_time=MIN_TIME):
+    agent = Agent(render=False, plot=False, verbose=False, save_model=False)
+    agent.n_games = 1000  # no random moves, always run the network
+    state = np.zeros(STATE_SIZE, dtype=np.uint8)
+    results = []
+    for length in lengths:
+        agent.env, _, _ = long_snake_env(length)
+        results.append(result('agent.get_state', ops_per_sec(lambda: agent.get_state(state), min_time),
+                              length=length))
+    results.append(result('agent.get_action', ops_per_sec(lambda: agent.get_action(state), min_time)))
+    for n in N_ENVS:
+        states = np.tile(state, (n, 1))
+        # ops are single actions
+        results.append(result('agent.get_actions', n * ops_per_sec(lambda: agent.get_actions(states), min_time),
+                              n_envs=n))
+    return results
+
+
+def bench_vector_env(n_envs=N_ENVS, min_time=MIN_TIME, seed=0):
+    rng = np.random.default_rng(seed)
+    results = []
+    for n in n_envs:
+        env = VectorEnvironment(n, seed=seed)
+        actions = rng.integers(0, 3, size=n)
+        # ops are single game steps / states
+        results.append(result('vector_env.step', n * ops_per_sec(lambda: env.step(actions), min_time), n_envs=n))
+        results.append(result('vector_env.get_states', n * ops_per_sec(env.get_states, min_time), n_envs=n))
+    return results
+
+
+def bench_grid(lengths=SNAKE_LENGTHS, n_envs=N_ENVS, batch_sizes=(1, 64), min_time=MIN_TIME, seed=0):
+    # grid observation: one move plus its encoding per op, which should not depend on the snake length
+    results = []
+    for length in lengths:
+        env, actions, pos = long_snake_env(length)
+        obs = GridObservation(env.fieldW, env.fieldH)
+        out = np.zeros(obs.shape, dtype=np.uint8)
+        n = len(actions)
+        step = [pos]
+
+        def change_all_encode():
+            env.frame_iteration = 0
+            env.change_all(actions[step[0]])
+            obs.encode(env, out)
+            step[0] = (step[0] + 1) % n
+
+        results.append(result('grid.change_all_encode', ops_per_sec(change_all_encode, min_time), length=length))
+
+    rng = np.random.default_rng(seed)
+    for n in n_envs:
+        vector_env = VectorEnvironment(n, seed=seed, observation='grid')
+        actions = rng.integers(0, 3, size=n)
+        results.append(result('vector_env.step', n * ops_per_sec(lambda: vector_env.step(actions), min_time),
+                              n_envs=n, observation='grid'))
+
+    shape = obs.shape
+    net = ConvQNet(*shape, 3)
+    trainer = QTrainer(net, lr=0.001, gamma=0.9)
+    for batch_size in batch_sizes:
+        states = torch.from_numpy(rng.integers(0, 256, size=(batch_size,) + shape, dtype=np.uint8)).float()
+        actions = torch.from_numpy(rng.integers(0, 3, size=batch_size))
+        rewards = torch.from_numpy(rng.choice([-10.0, 0.0, 10.0], size=batch_size)).float()
+        dones = rewards == -10
+
+        def forward():
+            with torch.inference_mode():
+                net(states)
+
+        def train_step():
+            trainer.train_step(states, actions, rewards, states, dones)
+
+        results.append(result('conv_net.forward', ops_per_sec(forward, min_time), batch_size=batch_size))
+        results.append(result('conv_net.train_step', ops_per_sec(train_step, min_time), batch_size=batch_size))
+    return results
+
+
+def bench_train_step(batch_sizes=BATCH_SIZES, min_time=MIN_TIME, seed=0):
+    rng = np.random.default_rng(seed)
+    agent = Agent(render=False, plot=False, verbose=False, save_model=False)
+    # the slowest target mode: a Polyak update of the target network after every step and two extra passes
+    double = QTrainer(LinearQNet(11, 256, 3), lr=agent.trainer.lr, gamma=agent.gamma, target_sync=1, tau=TAU,
+                      double=True)
+    results = []
+    for batch_size in batch_sizes:
+        states = torch.from_numpy(rng.integers(0, 2, size=(batch_size, 11))).float()
+        actions = torch.from_numpy(rng.integers(0, 3, size=batch_size))
+        rewards = torch.from_numpy(rng.choice([-10.0, 0.0, 10.0], size=batch_size)).float()
+        next_states = torch.from_numpy(rng.integers(0, 2, size=(batch_size, 11))).float()
+        dones = rewards == -10
+
+        def train_step():
+            agent.trainer.train_step(states, actions, rewards, next_states, dones)
+
+        def double_step():
+            double.train_step(states, actions, rewards, next_states, dones)
+
+        results.append(result('trainer.train_step', ops_per_sec(train_step, min_time), batch_size=batch_size))
+        results.append(result('trainer.train_step.double_soft', ops_per_sec(double_step, min_time),
+                              batch_size=batch_size))
+    return results
+
+
+def bench_export(batch_sizes=(1, 1024), min_time=MIN_TIME, seed=0):
+    # eager LinearQNet against the exported runners, greedy actions for a batch of states
+    rng = np.random.default_rng(seed)
+    results = []
+    with tempfile.TemporaryDirectory() as folder:
+        net = LinearQNet(11, 256, 3)
+        torch.save(net.state_dict(), os.path.join(folder, 'model.pth'))
+        formats = ['torchscript', 'numpy']
+        try:
+            import onnxruntime  # noqa: F401
+            formats.append('onnx')
+        except ImportError:
+            pass
+        export(net, os.path.join(folder, 'model'), formats)
+
+        for runner, ext in (('eager', '.pth'), ('torchscript', '.pt'), ('numpy', '.npz'), ('onnx', '.onnx')):
+            if runner != 'eager' and runner not in formats:
+                continue
+            start = time.perf_counter()
+            policy = load_policy(os.path.join(folder, 'model' + ext))
+            load_seconds = time.perf_counter() - start
+            for batch_size in batch_sizes:
+                states = rng.integers(0, 2, size=(batch_size, 11)).astype(np.uint8)
+                ops = ops_per_sec(lambda: policy.get_actions(states), min_time)
+                results.append(result('inference.get_actions', ops, runner=runner, batch_size=batch_size,
+                                      latency_us=1e6 / ops, load_seconds=load_seconds))
+    return results
+
+
+def fill_memory(memory, n, rng):
+    states = rng.integers(0, 2, size=(n, 11))
+    actions = rng.integers(0, 3, size=n)
+    rewards = rng.choice([-10, 0, 10], size=n)
+    for i in range(n):
+        memory.push(states[i], actions[i], rewards[i], states[(i + 1) % n], rewards[i] == -10)
+
+
+def memory_bytes(memory):
+    return sum(x.nbytes for x in vars(memory).values() if isinstance(x, np.ndarray))
+
+
+def bench_replay(capacity=100_000, batch_size=1000, min_time=MIN_TIME, seed=0):
+    rng = np.random.default_rng(seed)
+    uniform = ReplayBuffer(capacity, seed=seed)
+    prioritized = PrioritizedReplayBuffer(capacity, seed=seed)
+
+    start = time.perf_counter()
+    fill_memory(uniform, capacity, rng)
+    uniform_push = capacity / (time.perf_counter() - start)
+    start = time.perf_counter()
+    fill_memory(prioritized, capacity, rng)
+    prioritized_push = capacity / (time.perf_counter() - start)
+
+    def sample_and_update():
+        batch = prioritized.sample(batch_size)
+        prioritized.update_priorities(batch[-1], rng.normal(size=batch_size))
+
+    uniform_bytes = memory_bytes(uniform)
+    prioritized_bytes = memory_bytes(prioritized) + prioritized.priorities.tree.nbytes
+
+    with tempfile.TemporaryDirectory() as folder:
+        mapped = MappedReplayBuffer(os.path.join(folder, 'replay.bin'), capacity, seed=seed)
+        start = time.perf_counter()
+        fill_memory(mapped, capacity, rng)
+        mapped_push = capacity / (time.perf_counter() - start)
+        mapped_sample = ops_per_sec(lambda: mapped.sample(batch_size), min_time)
+        mapped_bytes = mapped.data.nbytes
+        mapped.close()
+
+    return [
+        result('replay.uniform.push', uniform_push, capacity=capacity, bytes=uniform_bytes),
+        result('replay.prioritized.push', prioritized_push, capacity=capacity, bytes=prioritized_bytes),
+        result('replay.uniform.sample', ops_per_sec(lambda: uniform.sample(batch_size), min_time),
+               capacity=capacity, batch_size=batch_size, bytes=uniform_bytes),
+        result('replay.prioritized.sample_update', ops_per_sec(sample_and_update, min_time),
+               capacity=capacity, batch_size=batch_size, bytes=prioritized_bytes),
+        result('replay.mapped.push', mapped_push, capacity=capacity, bytes=mapped_bytes),
+        result('replay.mapped.sample', mapped_sample, capacity=capacity, batch_size=batch_size, bytes=mapped_bytes),
+    ]
+
+
+def games_to_score(threshold, window=50, max_games=1000, seed=0, pretrain=None, **agent_kwargs):
+    # trains a fresh headless agent until the mean score of the last `window` games reaches threshold,
+    # after pretraining on the recordings in the pretrain folder when given (included in the seconds)
+    seed_all(seed)
+    agent = Agent(render=False, plot=False, verbose=False, save_model=False, seed=seed, **agent_kwargs)
+
+    def reached(a):
+        return len(a.plot_scores) >= window and np.mean(a.plot_scores[-window:]) >= threshold
+
+    start = time.perf_counter()
+    if pretrain is not None:
+        agent.pretrain(pretrain, seed=seed)
+    pretrain_seconds = time.perf_counter() - start
+    agent.train(max_games=max_games, stop=reached)
+    return {
+        'seed': seed,
+        'games': agent.n_games if reached(agent) else None,
+        'seconds': time.perf_counter() - start,
+        'pretrain_seconds': pretrain_seconds,
+        'final_mean': float(np.mean(agent.plot_scores[-window:])),
+    }
+
+
+def bench_sample_efficiency(name, configs, threshold, window, max_games, seeds):
+    results = []
+    for config_name, agent_kwargs in configs:
+        for seed in seeds:
+            record = {'name': name + '.' + config_name, 'threshold': threshold, 'window': window}
+            record.update(games_to_score(threshold, window, max_games, seed, **agent_kwargs))
+            results.append(record)
+    return results
+
+
+def bench_prioritized(threshold=5, window=50, max_games=1000, seeds=(0, 1, 2)):
+    configs = [('uniform', {}), ('prioritized', {'prioritized': True})]
+    return bench_sample_efficiency('games_to_score', configs, threshold, window, max_games, seeds)
+
+
+def bench_target(threshold=5, window=50, max_games=1000, seeds=(0, 1, 2)):
+    # games and seconds until the threshold, bootstrapping from the trained network vs a target network
+    configs = [
+        ('current', {}),
+        ('target_hard', {'target_sync': TARGET_SYNC}),
+        ('target_soft', {'target_sync': 1, 'tau': TAU}),
+        ('double', {'target_sync': TARGET_SYNC, 'double': True}),
+    ]
+    return bench_sample_efficiency('games_to_score', configs, threshold, window, max_games, seeds)
+
+
+def bench_schedule(threshold=5, window=50, max_games=1000, seeds=(0, 1, 2)):
+    # throughput against sample efficiency of the update schedules
+    configs = [
+        ('classic', {'schedule': 'classic'}),
+        ('batched', {'schedule': 'batched'}),
+        ('batched_every_step', {'schedule': SCHEDULES['batched'].replace(train_every=1, updates_per_step=1.0,
+                                                                         batch_size=32)}),
+    ]
+    return bench_sample_efficiency('games_to_score', configs, threshold, window, max_games, seeds)
+
+
+def bench_nstep(threshold=5, window=50, max_games=1000, seeds=(0, 1, 2), n_steps=N_STEPS):
+    # games and seconds until the threshold with n-step returns in replay against 1-step targets
+    configs = [('{}_step'.format(n), {'n_step': n}) for n in n_steps]
+    configs += [('batched_{}_step'.format(n), {'n_step': n, 'schedule': 'batched'}) for n in n_steps]
+    return bench_sample_efficiency('games_to_score', configs, threshold, window, max_games, seeds)
+
+
+def bench_planner(threshold=5, window=50, max_games=1000, seeds=(0, 1, 2), n_games=PLANNER_GAMES):
+    # the scripted planner as a baseline score and its game generation speed, then games and seconds until the
+    # threshold for agents pretrained on its games against the usual start from random weights
+    results = []
+    with tempfile.TemporaryDirectory() as folder:
+        scores, lengths, seconds = generate(folder, n_games, seed=seeds[0], processes=1)
+        results.append(result('planner.play', float(lengths.sum() / seconds), games=n_games,
+                              mean_score=float(scores.mean()), min_score=int(scores.min()),
+                              max_score=int(scores.max()), mean_game_length=float(lengths.mean())))
+        configs = [
+            ('random_init', {}),
+            ('pretrained', {'pretrain': folder, 'epsilon_games': 0}),
+        ]
+        results += bench_sample_efficiency('games_to_score', configs, threshold, window, max_games, seeds)
+    return results
+
+
+def environment_info():
+    try:
+        commit = subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True,
+                                check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        commit = None
+    return {
+        'commit': commit,
+        'python': platform.python_version(),
+        'torch': torch.__version__,
+        'numpy': np.__version__,
+        'machine': platform.machine(),
+        'processor': platform.processor(),
+        'torch_threads': torch.get_num_threads(),
+    }
+
+
+def compare(results, baseline_file, tolerance):
+    # ratio of ops/sec against a previous --output file, marking slowdowns beyond the tolerance
+    with open(baseline_file) as f:
+        baseline = {result_key(r): r for r in json.load(f)['results'] if 'ops_per_sec' in r}
+    for record in results:
+        old = baseline.get(result_key(record))
+        if old is None or 'ops_per_sec' not in record:
+            continue
+        ratio = record['ops_per_sec'] / old['ops_per_sec']
+        flag = '  REGRESSION' if ratio < 1 - tolerance else ''
+        print('{:<60} {:>8.2f}x{}'.format(result_key(record), ratio, flag))
+
+
+def parse_args(args=None):
+    parser = argparse.ArgumentParser(description='Snake AI benchmarks, one JSON result per line')
+    parser.add_argument('benchmarks', nargs='*', default=['env', 'vector_env', 'agent', 'train_step', 'replay'],
+                        help='env, vector_env, agent, train_step, replay, export, grid, prioritized, target, '
+                             'schedule, planner, nstep (default: all but export, grid, prioritized, target, '
+                             'schedule, planner and nstep)')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--min-time', type=float, default=MIN_TIME, help='seconds per measurement')
+    parser.add_argument('--output', help='also write all results with machine info to this JSON file')
+    parser.add_argument('--compare', help='print speed ratios against a previous --output file')
+    parser.add_argument('--tolerance', type=float, default=0.1, help='slowdown flagged as regression')
+    parser.add_argument('--threshold', type=float, default=5, help='mean score to reach')
+    parser.add_argument('--window', type=int, default=50, help='games averaged for the threshold')
+    parser.add_argument('--max-games', type=int, default=1000, help='give up after this many games')
+    parser.add_argument('--seeds', type=int, nargs='+', default=[0, 1, 2])
+    return parser.parse_args(args)
+
+
+def main(args=None):
+    args = parse_args(args)
+    seed_all(args.seed)
+    runs = {
+        'env': lambda: bench_env(min_time=args.min_time),
+        'vector_env': lambda: bench_vector_env(min_time=args.min_time, seed=args.seed),
+        'agent': lambda: bench_agent(min_time=args.min_time),
+        'train_step': lambda: bench_train_step(min_time=args.min_time, seed=args.seed),
+        'replay': lambda: bench_replay(min_time=args.min_time, seed=args.seed),
+        'export': lambda: bench_export(min_time=args.min_time, seed=args.seed),
+        'grid': lambda: bench_grid(min_time=args.min_time, seed=args.seed),
+        'prioritized': lambda: bench_prioritized(args.threshold, args.window, args.max_games, args.seeds),
+        'target': lambda: bench_target(args.threshold, args.window, args.max_games, args.seeds),
+        'schedule': lambda: bench_schedule(args.threshold, args.window, args.max_games, args.seeds),
+        'planner': lambda: bench_planner(args.threshold, args.window, args.max_games, args.seeds),
+        'nstep': lambda: bench_nstep(args.threshold, args.window, args.max_games, args.seeds),
+    }
+    results = []
+    for name in args.benchmarks:
+        for record in runs[name]():
+            print(json.dumps(record), flush=True)
+            results.append(record)
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump({'info': environment_info(), 'results': results}, f, indent=1)
+    if args.compare:
+        compare(results, args.compare, args.tolerance)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,128 @@
+import atexit
+import os
+import pickle
+import queue
+import shutil
+import sys
+import threading
+import numpy as np
+import torch
+
+KEEP = 3  # most recent checkpoints kept on disk
+LATEST = 'latest'
+
+
+def copy_state_dict(state_dict):
+    # detached copies, so training can go on while a writer thread saves them
+    return {name: value.detach().clone() if torch.is_tensor(value) else value for name, value in state_dict.items()}
+
+
+def save_state_dict(state_dict, file_name):
+    folder = os.path.dirname(file_name)
+    if folder and not os.path.exists(folder):
+        os.makedirs(folder)
+    tmp_name = file_name + '.tmp'
+    torch.save(state_dict, tmp_name)
+    os.replace(tmp_name, file_name)
+
+
+def write_file(file_name, data):
+    if file_name.endswith('.npy'):
+        np.save(file_name, data)
+    elif file_name.endswith('.pt'):
+        torch.save(data, file_name)
+    else:
+        with open(file_name, 'wb') as f:
+            pickle.dump(data, f, protocol=pickle.HIGHEST_PROTOCOL)
+
+
+def read_file(file_name):
+    if file_name.endswith('.npy'):
+        return np.load(file_name, mmap_mode='r')  # pages are read when the data is copied out
+    if file_name.endswith('.pt'):
+        return torch.load(file_name, map_location='cpu')
+    with open(file_name, 'rb') as f:
+        return pickle.load(f)
+
+
+# A checkpoint is a folder of files, {file name: data} with the format taken from the extension
+# (.npy arrays, .pt torch objects, anything else pickled). It is written to name.tmp, renamed into place
+# and only then recorded in the 'latest' file, so a crash never leaves a half written checkpoint as latest.
+def write_checkpoint(folder, name, files, keep=KEEP):
+    if not os.path.exists(folder):
+        os.makedirs(folder)
+    tmp_path = os.path.join(folder, name + '.tmp')
+    path = os.path.join(folder, name)
+    shutil.rmtree(tmp_path, ignore_errors=True)
+    os.makedirs(tmp_path)
+    for file_name, data in files.items():
+        write_file(os.path.join(tmp_path, file_name), data)
+    shutil.rmtree(path, ignore_errors=True)
+    os.replace(tmp_path, path)
+
+    latest_tmp = os.path.join(folder, LATEST + '.tmp')
+    with open(latest_tmp, 'w') as f:
+        f.write(name)
+    os.replace(latest_tmp, os.path.join(folder, LATEST))
+
+    # names sort by age, see Agent.save_checkpoint
+    old = sorted(d for d in os.listdir(folder)
+                 if os.path.isdir(os.path.join(folder, d)) and not d.endswith('.tmp') and d != name)
+    for d in old[:max(0, len(old) - keep + 1)]:
+        shutil.rmtree(os.path.join(folder, d), ignore_errors=True)
+
+
+def read_checkpoint(folder, name=None):
+    if name is None:
+        with open(os.path.join(folder, LATEST)) as f:
+            name = f.read().strip()
+    path = os.path.join(folder, name)
+    return {file_name: read_file(os.path.join(path, file_name)) for file_name in os.listdir(path)}
+
+
+# Runs save jobs one after the other in a background thread so the training loop never waits on disk.
+class AsyncWriter:
+    def __init__(self):
+        self.queue = queue.Queue()
+        self.checkpoint_pending = threading.Event()
+        self.thread = threading.Thread(target=self.run, daemon=True)
+        self.thread.start()
+        atexit.register(self.close)
+
+    def run(self):
+        while True:
+            job = self.queue.get()
+            try:
+                if job is None:
+                    return
+                fn, args = job
+                fn(*args)
+            except Exception as e:
+                print('Saving failed:', repr(e), file=sys.stderr)
+            finally:
+                self.queue.task_done()
+
+    def submit(self, fn, *args):
+        self.queue.put((fn, args))
+
+    def save_checkpoint(self, folder, name, files, keep=KEEP):
+        # skipped (returns False) while the previous checkpoint is still being written
+        if self.checkpoint_pending.is_set():
+            return False
+        self.checkpoint_pending.set()
+        self.submit(self.write_checkpoint, folder, name, files, keep)
+        return True
+
+    def write_checkpoint(self, folder, name, files, keep):
+        try:
+            write_checkpoint(folder, name, files, keep)
+        finally:
+            self.checkpoint_pending.clear()
+
+    def flush(self):
+        self.queue.join()
+
+    def close(self):
+        if self.thread.is_alive():
+            self.queue.put(None)
+            self.thread.join()
@@ -0,0 +1,187 @@
+import argparse
+import atexit
+import glob
+import os
+import numpy as np
+import torch
+from checkpoint import AsyncWriter
+from observation import STATE_SIZE
+
+CHUNK_SIZE = 65_536  # transitions per file
+SHUFFLE_CHUNKS = 4  # chunks mixed together when streaming shuffled batches
+BATCH_SIZE = 1000
+COLUMNS = ('states', 'actions', 'rewards', 'next_states', 'dones', 'games', 'steps')
+
+
+def new_columns(n, state_size=STATE_SIZE):
+    # state_size is a shape tuple for grid observations
+    state_shape = state_size if isinstance(state_size, tuple) else (state_size,)
+    return {
+        'states': np.zeros((n,) + state_shape, dtype=np.uint8),
+        'actions': np.zeros(n, dtype=np.uint8),
+        'rewards': np.zeros(n, dtype=np.float32),
+        'next_states': np.zeros((n,) + state_shape, dtype=np.uint8),
+        'dones': np.zeros(n, dtype=np.bool_),
+        'games': np.zeros(n, dtype=np.uint32),  # game id within the recording
+        'steps': np.zeros(n, dtype=np.uint32),  # step within the game
+    }
+
+
+def write_chunk(file_name, columns):
+    # compressed .npz with one array per column, renamed into place so readers never see half a chunk
+    tmp_name = file_name + '.tmp'
+    with open(tmp_name, 'wb') as f:
+        np.savez_compressed(f, **columns)
+    os.replace(tmp_name, file_name)
+
+
+def chunk_files(folders):
+    if isinstance(folders, str):
+        folders = [folders]
+    files = []
+    for folder in folders:
+        files += sorted(glob.glob(os.path.join(folder, 'chunk-*.npz')))
+    return files
+
+
+def next_chunk(folder):
+    # number of the next chunk file and the next game id, so more recordings can be added to a folder
+    files = chunk_files(folder)
+    first_game = 0
+    if files:
+        with np.load(files[-1]) as last:
+            if len(last['games']):
+                first_game = int(last['games'][-1]) + 1
+    return len(files), first_game
+
+
+# Streams transitions to folder/chunk-NNNNNN.npz. Columns fill preallocated arrays and a full chunk is
+# handed to a background writer thread for compression, so recording costs the training loop one row copy
+# per step. Recording into an existing folder continues after its last chunk and game: add() takes the game
+# number counted from the start of this recorder, which is added to the next game id of the folder.
+class TransitionRecorder:
+    def __init__(self, folder, chunk_size=CHUNK_SIZE, state_size=STATE_SIZE, writer=None):
+        if not os.path.exists(folder):
+            os.makedirs(folder)
+        self.folder = folder
+        self.chunk_size = chunk_size
+        self.state_size = state_size
+        self.writer = writer if writer is not None else AsyncWriter()
+
+        self.n_chunks, self.first_game = next_chunk(folder)
+        self.columns = new_columns(chunk_size, state_size)
+        self.n = 0
+        atexit.register(self.flush)  # keep the last partial chunk when training is interrupted
+
+    def add(self, state, action, reward, next_state, done, game, step):
+        i = self.n
+        columns = self.columns
+        columns['states'][i] = state
+        columns['actions'][i] = action
+        columns['rewards'][i] = reward
+        columns['next_states'][i] = next_state
+        columns['dones'][i] = done
+        columns['games'][i] = self.first_game + game
+        columns['steps'][i] = step
+        self.n = i + 1
+        if self.n == self.chunk_size:
+            self.flush()
+
+    def flush(self):
+        # writes what was added since the last chunk, also when it is less than chunk_size
+        if self.n == 0:
+            return
+        columns = {name: column[:self.n] for name, column in self.columns.items()}
+        file_name = os.path.join(self.folder, 'chunk-{:06d}.npz'.format(self.n_chunks))
+        self.writer.submit(write_chunk, file_name, columns)
+        self.n_chunks += 1
+        # the written arrays now belong to the writer thread
+        self.columns = new_columns(self.chunk_size, self.state_size)
+        self.n = 0
+
+    def close(self):
+        self.flush()
+        self.writer.flush()
+
+
+def read_chunks(folders, rng=None):
+    # one chunk at a time as {column: array}, in a random order when rng is given
+    files = chunk_files(folders)
+    if rng is not None:
+        files = [files[i] for i in rng.permutation(len(files))]
+    for file_name in files:
+        with np.load(file_name) as chunk:
+            yield {name: chunk[name] for name in COLUMNS}
+
+
+# Batches of (states, actions, rewards, next_states, dones) tensors in the form QTrainer.train_step takes,
+# streamed from recorded chunks. With shuffle, a window of shuffle_chunks random chunks is mixed at a time,
+# so memory stays at a few chunks however large the dataset is.
+def load_batches(folders, batch_size=BATCH_SIZE, shuffle=True, shuffle_chunks=SHUFFLE_CHUNKS, seed=None):
+    rng = np.random.default_rng(seed) if shuffle else None
+    chunks = read_chunks(folders, rng)
+    window = []
+    done = False
+    while not done:
+        try:
+            window.append(next(chunks))
+            if len(window) < shuffle_chunks:
+                continue
+        except StopIteration:
+            done = True
+        if not window:
+            break
+
+        columns = {name: np.concatenate([chunk[name] for chunk in window]) for name in COLUMNS[:5]}
+        window = []
+        n = len(columns['actions'])
+        order = rng.permutation(n) if rng is not None else np.arange(n)
+        for start in range(0, n, batch_size):
+            idx = order[start:start + batch_size]
+            yield (torch.from_numpy(columns['states'][idx]).float(),
+                   torch.from_numpy(columns['actions'][idx]).long(),
+                   torch.from_numpy(columns['rewards'][idx]),
+                   torch.from_numpy(columns['next_states'][idx]).float(),
+                   torch.from_numpy(columns['dones'][idx]))
+
+
+def train_offline(trainer, folders, epochs=1, batch_size=BATCH_SIZE, seed=None, margin=0.0):
+    # fits a QTrainer on recorded transitions, returns the number of updates. With margin > 0 the recorded
+    # actions are treated as expert moves (QTrainer.train_step margin), e.g. for games from planner.py.
+    updates = 0
+    for epoch in range(epochs):
+        for batch in load_batches(folders, batch_size, seed=None if seed is None else seed + epoch):
+            trainer.train_step(*batch, margin=margin)
+            updates += 1
+    return updates
+
+
+def parse_args(args=None):
+    parser = argparse.ArgumentParser(description='Train a network offline on recorded transitions')
+    parser.add_argument('folders', nargs='+', help='folders written by --record or snakeHuman.py --record')
+    parser.add_argument('--epochs', type=int, default=1)
+    parser.add_argument('--batch-size', type=int, default=BATCH_SIZE)
+    parser.add_argument('--lr', type=float, default=0.001)
+    parser.add_argument('--gamma', type=float, default=0.9)
+    parser.add_argument('--margin', type=float, default=0.0,
+                        help='imitate the recorded actions with this large-margin loss, 0 = plain Q-learning')
+    parser.add_argument('--seed', type=int)
+    parser.add_argument('--init', help='start from this saved model instead of a new network')
+    parser.add_argument('--output', default='model_offline.pth', help='file name in ./model for the trained network')
+    return parser.parse_args(args)
+
+
+def main(args=None):
+    from model import LinearQNet, QTrainer
+    args = parse_args(args)
+    if args.seed is not None:
+        torch.manual_seed(args.seed)
+    net = LinearQNet.load(args.init) if args.init else LinearQNet(STATE_SIZE, 256, 3)
+    trainer = QTrainer(net, lr=args.lr, gamma=args.gamma)
+    updates = train_offline(trainer, args.folders, args.epochs, args.batch_size, args.seed, args.margin)
+    print('Updates', updates, 'Loss', trainer.loss)
+    net.save(args.output)
+
+
+if __name__ == '__main__':
+    main()
@@ -1,12 +1,9 @@
-import pygame
 import random
 from enum import Enum
-from collections import namedtuple
+from itertools import islice
+from collections import namedtuple, deque, Counter
 import numpy as np
 
-pygame.init()
-font = pygame.font.SysFont('Arial', 25, bold=True)
-
 
 class Direction(Enum):
     RIGHT = 1
@@ -17,6 +14,9 @@ class Direction(Enum):
 
 Point = namedtuple('Point', 'x, y')
 
+CLOCK_WISE = [Direction.RIGHT, Direction.DOWN, Direction.LEFT, Direction.UP]
+TURN = (0, 1, -1)  # [straight, right, left] -> steps along CLOCK_WISE
+
 # rgb colors
 WHITE = (255, 255, 255)
 RED = (200, 0, 0)
@@ -27,38 +27,66 @@ BLACK = (0, 0, 0)
 SPEED = 200
 
 
+# Every game has its own seed for food placement, drawn from a generator seeded with seed (None = OS entropy)
+# or given to reset(). The seed and the actions are all it takes to play a game again (traces.py).
 class Environment:
-    def __init__(self, window_width=640, window_height=480, cell_size=20):
+    def __init__(self, window_width=640, window_height=480, cell_size=20, render=True, speed=SPEED, seed=None):
         self.cellSize = cell_size
+        self.windowW = window_width
+        self.windowH = window_height
         self.fieldW = window_width//cell_size
         self.fieldH = window_height//cell_size
-        # init display
-        self.display = pygame.display.set_mode((window_width, window_height))
-        pygame.display.set_caption('Snake')
-        self.clock = pygame.time.Clock()
+
+        # display is created lazily, so a headless environment never imports pygame
+        self.render = False
+        self.speed = speed
+        self.pygame = None
+        self.display = None
+        self.clock = None
+        self.font = None
+        self.set_render(render)
 
         self.snake = None
         self.food = None
         self.score = 0
+        self.seeds = random.Random(seed)
+        self.game_seed = None
 
         self.frame_iteration = 0
 
         self.reset()
 
-    def reset(self):
-        self.snake = Snake(self.fieldW//2, self.fieldH//2)
-        self.food = Food(self.fieldW, self.fieldH, self.snake.head.x + 1, self.snake.head.y + 1)
+    def reset(self, seed=None):
+        self.game_seed = seed if seed is not None else self.seeds.getrandbits(32)
+        self.snake = Snake(self.fieldW//2, self.fieldH//2, self.fieldW, self.fieldH)
+        self.food = Food(self.fieldW, self.fieldH, self.snake.head.x + 1, self.snake.head.y + 1,
+                         random.Random(self.game_seed))
         self.score = 0
 
         self.frame_iteration = 0
 
+    def set_render(self, render):
+        if render and self.display is None:
+            self.init_display()
+        self.render = render
+
+    def init_display(self):
+        import pygame
+        pygame.init()
+        self.pygame = pygame
+        self.font = pygame.font.SysFont('Arial', 25, bold=True)
+        self.display = pygame.display.set_mode((self.windowW, self.windowH))
+        pygame.display.set_caption('Snake')
+        self.clock = pygame.time.Clock()
+
     def change_all(self, action):
         self.frame_iteration += 1
         # 1. collect user input
-        for event in pygame.event.get():
-            if event.type == pygame.QUIT:
-                pygame.quit()
-                quit()
+        if self.render:
+            for event in self.pygame.event.get():
+                if event.type == self.pygame.QUIT:
+                    self.pygame.quit()
+                    quit()
         
         # 2. move
         self.snake.move(action)
@@ -75,57 +103,60 @@ class Environment:
         if self.snake.head == self.food.pt:
             self.score += 1
             reward = 10
-            while self.food.pt in self.snake.body:
-                self.food.place_food()
+            self.food.place_food(self.snake.free)
         else:
-            self.snake.body.pop()
+            self.snake.pop_tail()
         
         # 5. update ui and clock
-        self.draw_all()
-        self.clock.tick(SPEED)
+        if self.render:
+            self.draw_all()
+            self.clock.tick(self.speed)
         # 6. return game over and score
         return reward, game_over
 
     def draw_all(self):
+        pygame = self.pygame
         self.display.fill(BLACK)
 
         pygame.draw.rect(self.display, BLUE2, pygame.Rect(self.snake.head.x * self.cellSize,
                                                           self.snake.head.y * self.cellSize,
                                                           self.cellSize, self.cellSize))
-        for pt in self.snake.body[1:]:
+        for pt in islice(self.snake.body, 1, None):
             pygame.draw.rect(self.display, BLUE1, pygame.Rect(pt.x * self.cellSize, pt.y * self.cellSize,
                                                               self.cellSize, self.cellSize))
 
         pygame.draw.rect(self.display, RED, pygame.Rect(self.food.pt.x * self.cellSize, self.food.pt.y * self.cellSize,
                                                         self.cellSize, self.cellSize))
 
-        text = font.render("Score: " + str(self.score), True, WHITE)
+        text = self.font.render("Score: " + str(self.score), True, WHITE)
         self.display.blit(text, [0, 0])
         pygame.display.flip()
 
 
 class Snake:
-    def __init__(self, w, h):
+    def __init__(self, x, y, field_width, field_height):
         self.direction = Direction.RIGHT
 
-        self.head = Point(w, h)
-        self.body = [self.head, Point(self.head.x - 1, self.head.y), Point(self.head.x - 2, self.head.y)]
-
-    def move(self, action):
-        # [straight, right, left]
-        clock_wise = [Direction.RIGHT, Direction.DOWN, Direction.LEFT, Direction.UP]
-        idx = clock_wise.index(self.direction)
+        self.head = Point(x, y)
+        self.fieldW = field_width
+        self.fieldH = field_height
+        self.body = deque()
+        # occupancy of every cell, a cell is counted twice when the head runs into the body
+        self.cells = Counter()
+        # free cells with their positions, so food can be sampled and cells taken in O(1)
+        self.free = [Point(i, j) for j in range(field_height) for i in range(field_width)]
+        self.free_idx = {pt: i for i, pt in enumerate(self.free)}
 
-        if np.array_equal(action, [1, 0, 0]):
-            new_dir = clock_wise[idx]  # no change
-        elif np.array_equal(action, [0, 1, 0]):
-            next_idx = (idx + 1) % 4
-            new_dir = clock_wise[next_idx]  # right turn r -> d -> l -> u
-        else:  # [0, 0, 1]
-            next_idx = (idx - 1) % 4
-            new_dir = clock_wise[next_idx]  # left turn r -> u -> l -> d
+        for pt in (Point(x - 2, y), Point(x - 1, y), self.head):
+            self.push_head(pt)
 
-        self.direction = new_dir
+    def move(self, action):
+        # action index 0 = straight, 1 = right turn, 2 = left turn, or one-hot [straight, right, left]
+        if not isinstance(action, (int, np.integer)):
+            action = int(np.argmax(action))
+        idx = CLOCK_WISE.index(self.direction)
+        # no change, right turn r -> d -> l -> u, left turn r -> u -> l -> d
+        self.direction = CLOCK_WISE[(idx + TURN[action]) % 4]
 
         x = self.head.x
         y = self.head.y
@@ -139,28 +170,49 @@ class Snake:
             y -= 1
 
         self.head = Point(x, y)
-        self.body.insert(0, self.head)
+        self.push_head(self.head)
+
+    def push_head(self, pt):
+        self.body.appendleft(pt)
+        self.cells[pt] += 1
+        self.take_cell(pt)
+
+    def pop_tail(self):
+        pt = self.body.pop()
+        self.cells[pt] -= 1
+        if self.cells[pt] == 0:
+            del self.cells[pt]
+            if 0 <= pt.x < self.fieldW and 0 <= pt.y < self.fieldH:  # off-field cells never were free
+                self.free_idx[pt] = len(self.free)
+                self.free.append(pt)
+        return pt
+
+    def take_cell(self, pt):
+        idx = self.free_idx.pop(pt, None)
+        if idx is None:
+            return  # already taken or outside the field
+        last = self.free.pop()
+        if idx < len(self.free):
+            self.free[idx] = last
+            self.free_idx[last] = idx
 
     def is_collision(self, w, h):
         # hits boundary
         if self.head.x > w - 1 or self.head.x < 0 or self.head.y > h - 1 or self.head.y < 0:
             return True
         # hits itself
-        if self.head in self.body[1:]:  # TODO remove last element check
-            return True
-        return False
-
-    def is_collide_with_something(self, list_of_something):
-        if self.head.x in list_of_something:
+        if self.cells[self.head] > 1:
             return True
         return False
 
 
 class Food:
-    def __init__(self, field_width, field_height, x, y):
+    def __init__(self, field_width, field_height, x, y, rng=None):
         self.pt = Point(x, y)
         self.fieldW = field_width
         self.fieldH = field_height
+        self.rng = rng if rng is not None else random.Random()
 
-    def place_food(self):
-        self.pt = Point(random.randint(0, self.fieldW - 1), random.randint(0, self.fieldH - 1))
+    def place_food(self, free_cells):
+        if free_cells:  # a full board keeps the old food
+            self.pt = self.rng.choice(free_cells)
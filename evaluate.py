@@ -0,0 +1,110 @@
+import argparse
+import json
+import os
+import sys
+import time
+import multiprocessing as mp
+import numpy as np
+from environment import Environment
+from inference import load_policy
+from observation import STATE_SIZE, encode_state
+
+N_GAMES = 1000
+CHUNK_SIZE = 16  # games handed to a worker at once
+PERCENTILES = (5, 25, 50, 75, 95)
+
+policy = None  # per worker process
+
+
+def init_worker(model_file, numpy):
+    global policy
+    try:
+        import torch
+        torch.set_num_threads(1)
+    except ImportError:
+        pass
+    policy = load_policy(model_file, numpy=numpy)
+
+
+def play_game(seed):
+    # one greedy headless game with the training rules, food placement seeded per game
+    start = time.perf_counter()
+    env = Environment(render=False)
+    env.reset(seed)
+    state = np.zeros((1, STATE_SIZE), dtype=np.uint8)
+    steps = 0
+    done = False
+    while not done:
+        encode_state(env, state[0])
+        action = int(policy.get_actions(state)[0])
+        _, done = env.change_all(action)
+        steps += 1
+    return seed, env.score, steps, time.perf_counter() - start
+
+
+def evaluate(model_file, n_games=N_GAMES, seed=0, processes=None, numpy=True):
+    seeds = range(seed, seed + n_games)
+    start = time.perf_counter()
+    if processes == 1:
+        init_worker(model_file, numpy)
+        games = [play_game(s) for s in seeds]
+    else:
+        with mp.get_context('spawn').Pool(processes, initializer=init_worker, initargs=(model_file, numpy)) as pool:
+            games = list(pool.imap_unordered(play_game, seeds, chunksize=CHUNK_SIZE))
+    seconds = time.perf_counter() - start
+
+    games.sort()
+    scores = np.array([game[1] for game in games])
+    steps = np.array([game[2] for game in games])
+    play_seconds = sum(game[3] for game in games)
+    values, counts = np.unique(scores, return_counts=True)
+    return {
+        'model': model_file,
+        'games': n_games,
+        'seed': seed,
+        'mean': float(scores.mean()),
+        'std': float(scores.std()),
+        'median': float(np.median(scores)),
+        'min': int(scores.min()),
+        'max': int(scores.max()),
+        'percentiles': {str(p): float(np.percentile(scores, p)) for p in PERCENTILES},
+        'distribution': {str(v): int(c) for v, c in zip(values, counts)},
+        'mean_game_length': float(steps.mean()),
+        'steps_per_sec': float(steps.sum() / seconds),  # overall, including process start up
+        'worker_steps_per_sec': float(steps.sum() / play_seconds),  # of a single worker while playing
+        'games_per_sec': n_games / seconds,
+        'seconds': seconds,
+    }
+
+
+def parse_args(args=None):
+    parser = argparse.ArgumentParser(description='Play seeded greedy games with a saved model and report scores')
+    parser.add_argument('model', nargs='?', default='./model/model.pth', help='.pth, .npz, .pt or .onnx model')
+    parser.add_argument('--games', type=int, default=N_GAMES)
+    parser.add_argument('--seed', type=int, default=0, help='first game seed, game i uses seed + i')
+    parser.add_argument('--processes', type=int, default=os.cpu_count(), help='worker processes, 1 = no pool')
+    parser.add_argument('--torch', action='store_true', help='run a .pth with torch instead of NumPy')
+    parser.add_argument('--min-mean', type=float, help='exit with status 1 if the mean score is lower')
+    parser.add_argument('--json', action='store_true', help='print the report as JSON')
+    return parser.parse_args(args)
+
+
+def main(args=None):
+    args = parse_args(args)
+    report = evaluate(args.model, args.games, args.seed, args.processes, numpy=not args.torch)
+
+    if args.json:
+        print(json.dumps(report))
+    else:
+        print('Games', report['games'], 'Mean', round(report['mean'], 2), 'Median', report['median'],
+              'Min', report['min'], 'Max', report['max'])
+        print('Percentiles', ' '.join('p{}={}'.format(p, v) for p, v in report['percentiles'].items()))
+        print('Mean game length', round(report['mean_game_length'], 1), 'Steps/sec', round(report['steps_per_sec']),
+              'Games/sec', round(report['games_per_sec'], 1))
+
+    if args.min_mean is not None and report['mean'] < args.min_mean:
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,72 @@
+import argparse
+import os
+import numpy as np
+import torch
+from model import LinearQNet
+
+FORMATS = {
+    'torchscript': '.pt',
+    'onnx': '.onnx',
+    'numpy': '.npz',
+}
+
+
+def export_torchscript(net, file_name):
+    net.eval()
+    example = torch.zeros(1, net.linear1.in_features)
+    with torch.no_grad():
+        traced = torch.jit.trace(net, example)
+    traced = torch.jit.optimize_for_inference(torch.jit.freeze(traced))
+    traced.save(file_name)
+
+
+def export_onnx(net, file_name):
+    # needs the optional onnx package, and onnxruntime to run the result
+    net.eval()
+    example = torch.zeros(1, net.linear1.in_features)
+    torch.onnx.export(net, example, file_name, input_names=['state'], output_names=['q_values'],
+                      dynamic_axes={'state': {0: 'batch'}, 'q_values': {0: 'batch'}})
+
+
+def export_numpy(net, file_name):
+    np.savez(file_name, **{name: value.detach().numpy() for name, value in net.state_dict().items()})
+
+
+EXPORTERS = {
+    'torchscript': export_torchscript,
+    'onnx': export_onnx,
+    'numpy': export_numpy,
+}
+
+
+def export(net, file_base, formats=('torchscript', 'numpy')):
+    file_names = []
+    for fmt in formats:
+        file_name = file_base + FORMATS[fmt]
+        EXPORTERS[fmt](net, file_name)
+        file_names.append(file_name)
+    return file_names
+
+
+def parse_args(args=None):
+    parser = argparse.ArgumentParser(description='Export a trained LinearQNet for inference')
+    parser.add_argument('model', nargs='?', default='./model/model.pth', help='state_dict saved by training')
+    parser.add_argument('--formats', nargs='+', default=['torchscript', 'numpy'], choices=sorted(FORMATS))
+    parser.add_argument('--output', help='output path without extension, defaults to the model path')
+    return parser.parse_args(args)
+
+
+def main(args=None):
+    args = parse_args(args)
+    net = LinearQNet.load(args.model)
+    file_base = args.output or os.path.splitext(args.model)[0]
+    for fmt in args.formats:
+        try:
+            for file_name in export(net, file_base, [fmt]):
+                print('Exported', file_name)
+        except ImportError as e:
+            print('Skipped', fmt, '-', e)
+
+
+if __name__ == '__main__':
+    main()
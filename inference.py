@@ -0,0 +1,99 @@
+import os
+import numpy as np
+
+
+# Greedy policies for playing with a trained network, without autograd. All take (n, 11) states and
+# return (n,) action indices like Agent.get_actions with exploration turned off.
+
+# LinearQNet (11 -> hidden -> 3 MLP) as two NumPy matmuls, from its state_dict entries as arrays, e.g. an
+# .npz written by export.py. Importing this module and loading an .npz never imports torch.
+class NumpyQNet:
+    def __init__(self, weights):
+        self.w1 = np.ascontiguousarray(weights['linear1.weight'].T, dtype=np.float32)
+        self.b1 = weights['linear1.bias'].astype(np.float32)
+        self.w2 = np.ascontiguousarray(weights['linear2.weight'].T, dtype=np.float32)
+        self.b2 = weights['linear2.bias'].astype(np.float32)
+
+    @classmethod
+    def load(cls, file_name):
+        return cls(np.load(file_name))
+
+    @classmethod
+    def from_torch(cls, file_name):
+        import torch
+        state_dict = torch.load(file_name, map_location='cpu')
+        return cls({name: value.numpy() for name, value in state_dict.items()})
+
+    def forward(self, states):
+        hidden = np.asarray(states, dtype=np.float32) @ self.w1
+        hidden += self.b1
+        np.maximum(hidden, 0, out=hidden)
+        return hidden @ self.w2 + self.b2
+
+    def get_actions(self, states):
+        return np.argmax(self.forward(states), axis=1)
+
+
+class TorchScriptQNet:
+    def __init__(self, file_name):
+        import torch
+        self.torch = torch
+        self.model = torch.jit.load(file_name)
+        self.model.eval()
+
+    def forward(self, states):
+        torch = self.torch
+        with torch.inference_mode():
+            return self.model(torch.as_tensor(states, dtype=torch.float)).numpy()
+
+    def get_actions(self, states):
+        return np.argmax(self.forward(states), axis=1)
+
+
+class OnnxQNet:
+    def __init__(self, file_name):
+        import onnxruntime
+        self.session = onnxruntime.InferenceSession(file_name, providers=['CPUExecutionProvider'])
+        self.input_name = self.session.get_inputs()[0].name
+
+    def forward(self, states):
+        return self.session.run(None, {self.input_name: np.asarray(states, dtype=np.float32)})[0]
+
+    def get_actions(self, states):
+        return np.argmax(self.forward(states), axis=1)
+
+
+# eager LinearQNet from a state_dict .pth, the format Agent saves
+class EagerQNet:
+    def __init__(self, file_name):
+        import torch
+        from model import LinearQNet
+        self.torch = torch
+        self.model = LinearQNet.load(file_name)
+        self.model.eval()
+
+    def forward(self, states):
+        torch = self.torch
+        with torch.inference_mode():
+            return self.model(torch.as_tensor(states, dtype=torch.float)).numpy()
+
+    def get_actions(self, states):
+        return np.argmax(self.forward(states), axis=1)
+
+
+POLICIES = {
+    '.npz': NumpyQNet.load,
+    '.pt': TorchScriptQNet,
+    '.onnx': OnnxQNet,
+    '.pth': EagerQNet,
+}
+
+
+def load_policy(file_name, numpy=False):
+    # picks the runner from the file extension, numpy=True also runs a saved .pth with NumpyQNet
+    ext = os.path.splitext(file_name)[1]
+    if numpy and ext == '.pth':
+        return NumpyQNet.from_torch(file_name)
+    if ext not in POLICIES:
+        raise ValueError('unknown model format {!r}, expected one of {}'.format(ext, ', '.join(POLICIES)))
+    return POLICIES[ext](file_name)
@@ -0,0 +1,399 @@
+import atexit
+import json
+import os
+import numpy as np
+import torch
+
+
+# Replay memory in preallocated arrays used as a ring buffer, the oldest transition is overwritten
+# once capacity is reached. The 11 boolean state features (or the uint8 planes of a grid observation, with
+# state_size a shape tuple) and action indices are stored as uint8. With discounts=True every transition also
+# has the discount of its bootstrap value (gamma^n for n-step transitions), returned after the dones.
+class ReplayBuffer:
+    FIELDS = ('states', 'actions', 'rewards', 'next_states', 'dones')
+
+    def __init__(self, capacity, state_size=11, seed=None, discounts=False):
+        self.capacity = capacity
+        state_shape = state_size if isinstance(state_size, tuple) else (state_size,)
+        self.states = np.zeros((capacity,) + state_shape, dtype=np.uint8)
+        self.actions = np.zeros(capacity, dtype=np.uint8)
+        self.rewards = np.zeros(capacity, dtype=np.float32)
+        self.next_states = np.zeros((capacity,) + state_shape, dtype=np.uint8)
+        self.dones = np.zeros(capacity, dtype=np.bool_)
+        self.discounts = np.zeros(capacity, dtype=np.float32) if discounts else None
+        self.fields = self.FIELDS + ('discounts',) if discounts else self.FIELDS
+        self.rng = np.random.default_rng(seed)
+
+        self.pos = 0  # next slot to write
+        self.size = 0
+
+    def __len__(self):
+        return self.size
+
+    def push(self, state, action, reward, next_state, done, discount=None):
+        i = self.pos
+        self.states[i] = state
+        self.actions[i] = action
+        self.rewards[i] = reward
+        self.next_states[i] = next_state
+        self.dones[i] = done
+        if self.discounts is not None:
+            self.discounts[i] = discount
+
+        self.pos = (i + 1) % self.capacity
+        self.size = min(self.size + 1, self.capacity)
+
+    def push_batch(self, states, actions, rewards, next_states, dones, discounts=None):
+        n = len(states)
+        if n > self.capacity:
+            states, actions, rewards, next_states, dones = (
+                x[-self.capacity:] for x in (states, actions, rewards, next_states, dones))
+            if discounts is not None:
+                discounts = discounts[-self.capacity:]
+            n = self.capacity
+        idx = (self.pos + np.arange(n)) % self.capacity
+        self.states[idx] = states
+        self.actions[idx] = actions
+        self.rewards[idx] = rewards
+        self.next_states[idx] = next_states
+        self.dones[idx] = dones
+        if self.discounts is not None:
+            self.discounts[idx] = discounts
+
+        self.pos = (self.pos + n) % self.capacity
+        self.size = min(self.size + n, self.capacity)
+        return idx
+
+    def sample(self, batch_size):
+        if self.size > batch_size:
+            idx = self.rng.integers(0, self.size, size=batch_size)
+        else:
+            idx = np.arange(self.size)
+        return self.get(idx)
+
+    def get(self, idx):
+        # fancy indexing gathers into fresh contiguous arrays, which torch then shares without copying
+        batch = (torch.from_numpy(self.states[idx]).float(),
+                 torch.from_numpy(self.actions[idx]).long(),
+                 torch.from_numpy(self.rewards[idx]),
+                 torch.from_numpy(self.next_states[idx]).float(),
+                 torch.from_numpy(self.dones[idx]))
+        if self.discounts is not None:
+            batch += (torch.from_numpy(self.discounts[idx]),)
+        return batch
+
+    def snapshot(self):
+        # copies of the filled part as {name: array} plus the ring position and sampling RNG,
+        # taken between steps so a writer thread can save them while training goes on
+        arrays = {name: getattr(self, name)[:self.size].copy() for name in self.fields}
+        info = {'capacity': self.capacity, 'pos': self.pos, 'size': self.size, 'rng': self.rng.bit_generator.state,
+                'discounts': self.discounts is not None}
+        return arrays, info
+
+    def restore(self, arrays, info):
+        if info['capacity'] != self.capacity:
+            raise ValueError('replay capacity {} does not match the saved {}'.format(self.capacity, info['capacity']))
+        size = info['size']
+        if info.get('discounts', False) != (self.discounts is not None):
+            raise ValueError('saved replay and this one differ in n-step discounts')
+        for name in self.fields:
+            getattr(self, name)[:size] = arrays[name][:size]
+        self.pos = info['pos']
+        self.size = size
+        self.rng.bit_generator.state = info['rng']
+
+
+# Replay memory in a numpy.memmap file, so the capacity is bounded by disk instead of RAM. A transition is
+# one packed record (state features as bits, action as uint8, reward as int8), 7 bytes for 11 features instead
+# of 28 in ReplayBuffer, so a sampled transition touches one page of the file instead of five. Sampled records
+# are read in file order. pos and size are kept next to the data in path + '.json' by flush(), and an existing
+# buffer is reopened with them after a restart.
+class MappedReplayBuffer:
+    def __init__(self, path, capacity, state_size=11, seed=None):
+        if isinstance(state_size, tuple):
+            raise ValueError('only the 11 boolean features can be bit-packed, not a grid observation')
+        self.path = path
+        self.meta_path = path + '.json'
+        self.capacity = capacity
+        self.state_size = state_size
+        n_bytes = (state_size + 7) // 8
+        self.dtype = np.dtype([('state', np.uint8, (n_bytes,)), ('next_state', np.uint8, (n_bytes,)),
+                               ('action', np.uint8), ('reward', np.int8), ('done', np.bool_)])
+        self.rng = np.random.default_rng(seed)
+
+        self.pos = 0  # next slot to write
+        self.size = 0
+        mode = 'w+'
+        if os.path.exists(path) and os.path.exists(self.meta_path):
+            with open(self.meta_path) as f:
+                meta = json.load(f)
+            if meta['capacity'] != capacity or meta['state_size'] != state_size:
+                raise ValueError('{} holds {} transitions of {} features, not {} of {}'.format(
+                    path, meta['capacity'], meta['state_size'], capacity, state_size))
+            self.pos = meta['pos']
+            self.size = meta['size']
+            mode = 'r+'
+        folder = os.path.dirname(path)
+        if folder and not os.path.exists(folder):
+            os.makedirs(folder)
+        self.data = np.memmap(path, dtype=self.dtype, mode=mode, shape=(capacity,))
+        self.saved = None  # records as of the last snapshot, see snapshot()
+        self.dirty = capacity  # slots written since the last snapshot
+        atexit.register(self.flush)
+
+    def __len__(self):
+        return self.size
+
+    def pack(self, states):
+        return np.packbits(np.asarray(states, dtype=np.uint8), axis=-1)
+
+    def push(self, state, action, reward, next_state, done):
+        self.data[self.pos] = (self.pack(state), self.pack(next_state), action, reward, done)
+        self.pos = (self.pos + 1) % self.capacity
+        self.size = min(self.size + 1, self.capacity)
+        self.dirty = min(self.dirty + 1, self.capacity)
+
+    def push_batch(self, states, actions, rewards, next_states, dones):
+        n = len(states)
+        if n > self.capacity:
+            states, actions, rewards, next_states, dones = (
+                x[-self.capacity:] for x in (states, actions, rewards, next_states, dones))
+            n = self.capacity
+        idx = (self.pos + np.arange(n)) % self.capacity
+        self.write(idx, states, actions, rewards, next_states, dones)
+        self.pos = (self.pos + n) % self.capacity
+        self.size = min(self.size + n, self.capacity)
+        self.dirty = min(self.dirty + n, self.capacity)
+        return idx
+
+    def write(self, idx, states, actions, rewards, next_states, dones):
+        records = np.empty(len(idx), dtype=self.dtype)
+        records['state'] = self.pack(states)
+        records['next_state'] = self.pack(next_states)
+        records['action'] = actions
+        records['reward'] = np.rint(rewards)
+        records['done'] = dones
+        self.data[idx] = records
+
+    def sample(self, batch_size):
+        if self.size > batch_size:
+            # sorted, so the pages are read front to back; the order within a batch does not matter
+            idx = np.sort(self.rng.integers(0, self.size, size=batch_size))
+        else:
+            idx = np.arange(self.size)
+        return self.get(idx)
+
+    def get(self, idx):
+        records = self.data[idx]  # one gather from the mapping into a small in-memory array
+        n = self.state_size
+        return (torch.from_numpy(np.unpackbits(records['state'], axis=1, count=n)).float(),
+                torch.from_numpy(records['action']).long(),
+                torch.from_numpy(records['reward'].astype(np.float32)),
+                torch.from_numpy(np.unpackbits(records['next_state'], axis=1, count=n)).float(),
+                torch.from_numpy(records['done']))
+
+    def flush(self):
+        self.data.flush()
+        meta = {'capacity': self.capacity, 'state_size': self.state_size, 'pos': self.pos, 'size': self.size}
+        tmp_path = self.meta_path + '.tmp'
+        with open(tmp_path, 'w') as f:
+            json.dump(meta, f)
+        os.replace(tmp_path, self.meta_path)
+
+    def close(self):
+        self.flush()
+        atexit.unregister(self.flush)
+        self.data = None
+        self.saved = None
+
+    def save_file(self):
+        if self.saved is None:
+            self.saved = np.memmap(self.path + '.saved', dtype=self.dtype, mode='w+', shape=(self.capacity,))
+        return self.saved
+
+    def snapshot(self):
+        # Training keeps overwriting the file after a checkpoint, so a checkpoint needs its own copy of the
+        # records to resume from any checkpoint as if never stopped. The records as of the last snapshot are kept
+        # in a second file of the same size, path + '.saved', and a snapshot only copies the slots written since
+        # (the first one after opening copies them all). The returned records are a view of that file: writing
+        # them, size * 7 bytes per checkpoint and KEEP checkpoints on disk, is left to the checkpoint writer
+        # thread, and the next snapshot must wait until it is done (Agent skips checkpoints until then).
+        self.flush()
+        saved = self.save_file()
+        if self.dirty >= self.size:
+            saved[:self.size] = self.data[:self.size]
+        elif self.dirty > 0:
+            idx = (self.pos - self.dirty + np.arange(self.dirty)) % self.capacity
+            saved[idx] = self.data[idx]
+        self.dirty = 0
+        arrays = {'records': saved[:self.size]}
+        return arrays, {'capacity': self.capacity, 'pos': self.pos, 'size': self.size, 'path': self.path,
+                        'rng': self.rng.bit_generator.state}
+
+    def restore(self, arrays, info):
+        if info['capacity'] != self.capacity:
+            raise ValueError('replay capacity {} does not match the saved {}'.format(self.capacity, info['capacity']))
+        if info.get('discounts', False):
+            raise ValueError('n-step transitions do not fit the packed records of a mapped buffer')
+        size = info['size']
+        if 'records' in arrays:
+            self.data[:size] = arrays['records'][:size]
+        elif arrays:
+            # saved from an in-memory ReplayBuffer
+            self.write(np.arange(size), *(arrays[name][:size] for name in ReplayBuffer.FIELDS))
+        else:
+            raise ValueError('the checkpoint has no copy of the replay file, it can only be resumed with the file '
+                             'as it was when the checkpoint was taken')
+        self.pos = info['pos']
+        self.size = info['size']
+        self.rng.bit_generator.state = info['rng']
+        # the restored records are what the next snapshot starts from
+        self.save_file()[:size] = self.data[:size]
+        self.dirty = 0
+
+
+# Binary tree over a power-of-two number of leaves stored in one array (root at 1, leaves at
+# n_leaves..2*n_leaves-1), each node holding the sum of its children. Batched updates and
+# proportional lookups walk the log(n) levels vectorized over the whole batch.
+class SumTree:
+    def __init__(self, capacity):
+        self.n_leaves = 1
+        while self.n_leaves < capacity:
+            self.n_leaves *= 2
+        self.tree = np.zeros(2 * self.n_leaves, dtype=np.float64)
+
+    def total(self):
+        return self.tree[1]
+
+    def set(self, i, value):
+        node = i + self.n_leaves
+        self.tree[node] = value
+        node //= 2
+        while node >= 1:
+            self.tree[node] = self.tree[2 * node] + self.tree[2 * node + 1]
+            node //= 2
+
+    def update(self, idx, values):
+        nodes = np.asarray(idx) + self.n_leaves
+        self.tree[nodes] = values
+        nodes = np.unique(nodes // 2)
+        while nodes[0] >= 1:
+            self.tree[nodes] = self.tree[2 * nodes] + self.tree[2 * nodes + 1]
+            nodes = np.unique(nodes // 2)
+
+    def find(self, values):
+        # leaf whose prefix-sum interval contains each value
+        values = np.array(values, dtype=np.float64)
+        nodes = np.ones(len(values), dtype=np.int64)
+        while nodes[0] < self.n_leaves:
+            left = 2 * nodes
+            go_right = values > self.tree[left]
+            values -= self.tree[left] * go_right
+            nodes = left + go_right
+        return nodes - self.n_leaves
+
+    def get(self, idx):
+        return self.tree[np.asarray(idx) + self.n_leaves]
+
+
+# Proportional prioritized replay: transitions are sampled with probability p^alpha / sum p^alpha
+# where p is the last TD error, and importance-sampling weights (N * P)^-beta correct the bias.
+class PrioritizedReplayBuffer(ReplayBuffer):
+    def __init__(self, capacity, state_size=11, alpha=0.6, beta=0.4, beta_increment=0.001,
+                 eps=1e-5, seed=None, discounts=False):
+        super().__init__(capacity, state_size, seed, discounts)
+        self.alpha = alpha
+        self.beta = beta
+        self.beta_increment = beta_increment
+        self.eps = eps
+        self.priorities = SumTree(capacity)
+        self.max_priority = 1.0
+
+    def push(self, state, action, reward, next_state, done, discount=None):
+        # new transitions get the highest priority so they are replayed at least once
+        self.priorities.set(self.pos, self.max_priority ** self.alpha)
+        super().push(state, action, reward, next_state, done, discount)
+
+    def push_batch(self, states, actions, rewards, next_states, dones, discounts=None):
+        idx = super().push_batch(states, actions, rewards, next_states, dones, discounts)
+        self.priorities.update(idx, np.full(len(idx), self.max_priority ** self.alpha))
+        return idx
+
+    def sample(self, batch_size):
+        batch_size = min(batch_size, self.size)
+        total = self.priorities.total()
+
+        # stratified: one value from each of batch_size equal segments of the total priority
+        values = (np.arange(batch_size) + self.rng.random(batch_size)) * (total / batch_size)
+        idx = np.minimum(self.priorities.find(values), self.size - 1)
+
+        probs = self.priorities.get(idx) / total
+        weights = (self.size * probs) ** -self.beta
+        weights /= weights.max()
+        self.beta = min(1.0, self.beta + self.beta_increment)
+
+        return self.get(idx) + (torch.from_numpy(weights.astype(np.float32)), idx)
+
+    def update_priorities(self, idx, td_errors):
+        priorities = np.abs(np.asarray(td_errors, dtype=np.float64)) + self.eps
+        self.priorities.update(idx, priorities ** self.alpha)
+        self.max_priority = max(self.max_priority, priorities.max())
+
+    def snapshot(self):
+        arrays, info = super().snapshot()
+        arrays['priorities'] = self.priorities.tree.copy()
+        info.update(beta=self.beta, max_priority=self.max_priority)
+        return arrays, info
+
+    def restore(self, arrays, info):
+        super().restore(arrays, info)
+        if 'priorities' in arrays:
+            self.priorities.tree[:] = arrays['priorities']
+            self.beta = info['beta']
+            self.max_priority = info['max_priority']
+        elif self.size:
+            # saved from a uniform buffer: everything starts at the highest priority
+            self.priorities.update(np.arange(self.size), np.full(self.size, self.max_priority ** self.alpha))
+
+
+# Turns the 1-step transitions of one game into n-step ones for a replay buffer with discounts: the reward is
+# the discounted sum of the next n rewards and next_state the state n steps later, bootstrapped with gamma^n.
+# The window keeps the last n transitions of the game and every step moves the oldest one to the buffer. At
+# the end of the game all of them go in as terminal transitions with the rewards left until the end and a
+# discount of 0, as there is nothing to bootstrap from. The sum is a loop over at most n rewards per
+# transition: a running sum would divide by gamma every step and blow up its rounding error over a long game.
+class NStepWindow:
+    def __init__(self, n, gamma, state_size=11):
+        state_shape = state_size if isinstance(state_size, tuple) else (state_size,)
+        self.n = n
+        self.powers = [gamma ** k for k in range(n + 1)]
+        self.states = np.zeros((n,) + state_shape, dtype=np.uint8)  # copies, callers reuse their state arrays
+        self.actions = [0] * n
+        self.rewards = [0.0] * n
+        self.start = 0  # oldest transition
+        self.size = 0
+
+    def __len__(self):
+        return self.size
+
+    def push(self, memory, state, action, reward, next_state, done):
+        i = (self.start + self.size) % self.n
+        self.states[i] = state
+        self.actions[i] = action
+        self.rewards[i] = reward
+        self.size += 1
+        if done:
+            while self.size:
+                self.emit(memory, next_state, True)
+        elif self.size == self.n:
+            self.emit(memory, next_state, False)
+
+    def emit(self, memory, next_state, done):
+        start = self.start
+        total = 0.0
+        for k in range(self.size):
+            total += self.powers[k] * self.rewards[(start + k) % self.n]
+        memory.push(self.states[start], self.actions[start], total, next_state, done,
+                    0.0 if done else self.powers[self.size])
+        self.start = (start + 1) % self.n
+        self.size -= 1
@@ -0,0 +1,88 @@
+import json
+import time
+
+LOG_INTERVAL = 10.0  # seconds between periodic records
+
+
+class Phase:
+    __slots__ = ('total', 'count', 'start')
+
+    def __init__(self):
+        self.total = 0.0
+        self.count = 0
+        self.start = 0.0
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+
+    def __exit__(self, *exc):
+        self.total += time.perf_counter() - self.start
+        self.count += 1
+
+
+# Training instrumentation: times named phases of the loop and appends one JSON object per line to
+# file_name, a 'game' record after every game and a 'periodic' record with throughput and the time
+# split between phases every interval seconds. Without a file the counters still run but nothing is written.
+class Metrics:
+    def __init__(self, file_name=None, interval=LOG_INTERVAL):
+        self.file = open(file_name, 'a') if file_name is not None else None
+        self.interval = interval
+        self.phases = {}
+        self.env_steps = 0
+
+        self.start = time.perf_counter()
+        self.last_time = self.start
+        self.last_env_steps = 0
+        self.last_phases = {}
+
+    def time(self, name):
+        # reusable context manager: with metrics.time('get_state'): ...
+        phase = self.phases.get(name)
+        if phase is None:
+            phase = self.phases[name] = Phase()
+        return phase
+
+    def step(self, n=1):
+        self.env_steps += n
+
+    def due(self):
+        return self.file is not None and time.perf_counter() - self.last_time >= self.interval
+
+    def game(self, **fields):
+        self.write('game', fields)
+
+    def periodic(self, **fields):
+        now = time.perf_counter()
+        elapsed = now - self.last_time
+
+        phase_seconds = {}
+        train_steps = 0
+        for name, phase in self.phases.items():
+            last_total, last_count = self.last_phases.get(name, (0.0, 0))
+            phase_seconds[name] = round(phase.total - last_total, 6)
+            if name.startswith('train_'):
+                train_steps += phase.count - last_count
+            self.last_phases[name] = (phase.total, phase.count)
+
+        fields.update({
+            'env_steps': self.env_steps,
+            'env_steps_per_sec': (self.env_steps - self.last_env_steps) / elapsed,
+            'train_steps_per_sec': train_steps / elapsed,
+            'phase_seconds': phase_seconds,
+        })
+        self.last_time = now
+        self.last_env_steps = self.env_steps
+        self.write('periodic', fields)
+        self.file.flush()
+
+    def write(self, kind, fields):
+        if self.file is None:
+            return
+        record = {'type': kind, 'time': round(time.perf_counter() - self.start, 6)}
+        record.update(fields)
+        self.file.write(json.dumps(record, separators=(',', ':')) + '\n')
+
+    def close(self):
+        if self.file is not None:
+            self.file.close()
+            self.file = None
@@ -1,3 +1,4 @@
+import copy
 import torch
 import torch.nn as nn
 import torch.optim as optim
@@ -24,46 +25,149 @@ class LinearQNet(nn.Module):
         file_name = os.path.join(model_folder_path, file_name)
         torch.save(self.state_dict(), file_name)
 
+    @classmethod
+    def load(cls, file_name='./model/model.pth'):
+        # layer sizes are taken from the saved weights
+        state_dict = torch.load(file_name, map_location='cpu')
+        hidden_size, input_size = state_dict['linear1.weight'].shape
+        net = cls(input_size, hidden_size, state_dict['linear2.weight'].shape[0])
+        net.load_state_dict(state_dict)
+        return net
 
+
+# Small convolutional Q-network for the grid observation (observation.grid_shape), uint8 planes scaled to 0..1.
+# Like LinearQNet it takes a single state or a batch.
+class ConvQNet(nn.Module):
+    def __init__(self, channels, height, width, output_size, hidden_size=128):
+        super().__init__()
+        self.conv1 = nn.Conv2d(channels, 16, 3, padding=1)
+        self.conv2 = nn.Conv2d(16, 32, 3, stride=2, padding=1)
+        self.conv3 = nn.Conv2d(32, 32, 3, stride=2, padding=1)
+        for _ in range(2):  # the strided convolutions halve the board, rounding up
+            height = (height + 1) // 2
+            width = (width + 1) // 2
+        self.linear1 = nn.Linear(32 * height * width, hidden_size)
+        self.linear2 = nn.Linear(hidden_size, output_size)
+
+    def forward(self, x):
+        single = x.dim() == 3
+        if single:
+            x = x.unsqueeze(0)
+        x = x / 255
+        x = func.relu(self.conv1(x))
+        x = func.relu(self.conv2(x))
+        x = func.relu(self.conv3(x))
+        x = func.relu(self.linear1(x.flatten(1)))
+        x = self.linear2(x)
+        return x.squeeze(0) if single else x
+
+    save = LinearQNet.save
+
+    @classmethod
+    def load(cls, file_name, height, width):
+        # the board size is not in the weights, the rest is
+        state_dict = torch.load(file_name, map_location='cpu')
+        net = cls(state_dict['conv1.weight'].shape[1], height, width, state_dict['linear2.weight'].shape[0],
+                  state_dict['linear1.weight'].shape[0])
+        net.load_state_dict(state_dict)
+        return net
+
+
+# Q-learning updates of model. With target_sync > 0 a frozen copy of the network provides the bootstrap
+# values and follows the model every target_sync updates, as a hard copy with tau=1 or a Polyak average
+# target <- tau * model + (1 - tau) * target (e.g. target_sync=1, tau=0.005). With double=True the model picks
+# the next action and the target network values it (Double DQN).
+# train_step with margin > 0 also treats the actions as expert moves and adds the large-margin loss of DQfD,
+# max_a(Q(s, a) + margin * [a != expert]) - Q(s, expert), so the expert action ends up with the highest value.
+# A discount tensor replaces gamma per transition, for n-step returns from replay (memory.NStepWindow).
 class QTrainer:
-    def __init__(self, model, lr, gamma):
+    def __init__(self, model, lr, gamma, target_sync=0, tau=1.0, double=False):
         self.lr = lr
         self.gamma = gamma
         self.model = model
         self.optimizer = optim.Adam(model.parameters(), lr=self.lr)
         self.criterion = nn.MSELoss()
+        self.loss = None  # of the last step, for logging
+
+        if double and target_sync <= 0:
+            raise ValueError('double DQN needs a target network, target_sync > 0')
+        self.target_sync = target_sync
+        self.tau = tau
+        self.double = double
+        self.updates = 0
+        self.target_model = None
+        if target_sync > 0:
+            # from the eager module behind a torch.compile wrapper
+            self.target_model = copy.deepcopy(getattr(model, '_orig_mod', model))
+            self.target_model.requires_grad_(False)
 
-    def train_step(self, state, action, reward, next_state, done):
-        state = torch.tensor(state, dtype=torch.float)
-        next_state = torch.tensor(next_state, dtype=torch.float)
-        action = torch.tensor(action, dtype=torch.long)
-        reward = torch.tensor(reward, dtype=torch.float)
+    def sync_target(self):
+        with torch.no_grad():
+            for target, param in zip(self.target_model.parameters(), self.model.parameters()):
+                if self.tau >= 1:
+                    target.copy_(param)
+                else:
+                    target.lerp_(param, self.tau)
+
+    def train_step(self, state, action, reward, next_state, done, weights=None, margin=0.0, discount=None):
+        # tensors (e.g. from ReplayBuffer) are used as they are, anything else is converted once
+        state = torch.as_tensor(state, dtype=torch.float)
+        next_state = torch.as_tensor(next_state, dtype=torch.float)
+        action = torch.as_tensor(action, dtype=torch.long)
+        reward = torch.as_tensor(reward, dtype=torch.float)
+        done = torch.as_tensor(done, dtype=torch.bool)
         # (n, x)
 
-        if len(state.shape) == 1:
-            # (1, x)
+        if reward.dim() == 0:
+            # a single transition, (1, x)
             state = torch.unsqueeze(state, 0)
             next_state = torch.unsqueeze(next_state, 0)
             action = torch.unsqueeze(action, 0)
             reward = torch.unsqueeze(reward, 0)
-            done = (done, )
+            done = torch.unsqueeze(done, 0)
+
+        if len(action.shape) == 2:
+            action = torch.argmax(action, dim=1)  # one-hot -> index
 
         # 1: predicted Q values with current state
         prediction = self.model(state)
 
-        target = prediction.clone()
-        for idx in range(len(done)):
-            q_value_new = reward[idx]
-            if not done[idx]:
-                q_value_new = reward[idx] + self.gamma * torch.max(self.model(next_state[idx]))
-
-            target[idx][torch.argmax(action[idx]).item()] = q_value_new
-    
         # 2: Q_new = r + y * max(next_predicted Q value) -> only do this if not done
-        # prediction.clone()
+        with torch.no_grad():
+            if self.target_model is None:
+                q_next = torch.max(self.model(next_state), dim=1)[0]
+            elif self.double:
+                # the model picks the next action, the target network values it
+                next_action = torch.argmax(self.model(next_state), dim=1, keepdim=True)
+                q_next = self.target_model(next_state).gather(1, next_action).squeeze(1)
+            else:
+                q_next = torch.max(self.target_model(next_state), dim=1)[0]
+            # per transition discounts of n-step returns (gamma^n), gamma for 1-step transitions
+            gamma = self.gamma if discount is None else discount
+            q_value_new = reward + gamma * q_next * ~done
+
         # predictions[argmax(action)] = Q_new
+        target = prediction.detach().clone()
+        target.scatter_(1, action.unsqueeze(1), q_value_new.unsqueeze(1))
+
         self.optimizer.zero_grad()
-        loss = self.criterion(target, prediction)
+        if weights is None:
+            loss = self.criterion(target, prediction)
+        else:
+            # importance-sampling weighted MSE for prioritized replay
+            loss = (torch.mean((target - prediction) ** 2, dim=1) * weights).mean()
+        if margin > 0:
+            margins = torch.full_like(prediction, margin)
+            margins.scatter_(1, action.unsqueeze(1), 0.0)
+            expert_q = prediction.gather(1, action.unsqueeze(1)).squeeze(1)
+            loss = loss + (torch.max(prediction + margins, dim=1)[0] - expert_q).mean()
         loss.backward()
 
         self.optimizer.step()
+        self.loss = loss.item()
+        self.updates += 1
+        if self.target_model is not None and self.updates % self.target_sync == 0:
+            self.sync_target()
+
+        # TD errors, used as new priorities by prioritized replay
+        return (q_value_new - prediction.detach().gather(1, action.unsqueeze(1)).squeeze(1)).numpy()
@@ -0,0 +1,176 @@
+import numpy as np
+from environment import CLOCK_WISE
+
+STATE_SIZE = 11
+
+# clockwise order used for turning: right -> down -> left -> up
+RIGHT = 0
+DOWN = 1
+LEFT = 2
+UP = 3
+DIRECTION_INDEX = {direction: i for i, direction in enumerate(CLOCK_WISE)}
+DELTA_X = np.array([1, 0, -1, 0], dtype=np.int64)
+DELTA_Y = np.array([0, 1, 0, -1], dtype=np.int64)
+
+# offsets of the cells straight ahead, to the right and to the left for each direction index
+AHEAD = [[(int(DELTA_X[(d + turn) % 4]), int(DELTA_Y[(d + turn) % 4])) for turn in (0, 1, -1)] for d in range(4)]
+
+
+# The 11 state features of one game:
+#   danger straight, right, left (wall or body in the next cell), move direction left, right, up, down,
+#   food left, right, up, down
+# written into a caller supplied uint8 buffer, so the training loop does not allocate per step.
+def encode_state(env, out=None):
+    if out is None:
+        out = np.zeros(STATE_SIZE, dtype=np.uint8)
+    snake = env.snake
+    x = snake.head.x
+    y = snake.head.y
+    w = env.fieldW
+    h = env.fieldH
+    cells = snake.cells
+    d = DIRECTION_INDEX[snake.direction]
+
+    for i, (dx, dy) in enumerate(AHEAD[d]):
+        nx = x + dx
+        ny = y + dy
+        out[i] = nx < 0 or nx >= w or ny < 0 or ny >= h or (nx, ny) in cells
+
+    out[3] = d == LEFT
+    out[4] = d == RIGHT
+    out[5] = d == UP
+    out[6] = d == DOWN
+
+    food = env.food.pt
+    out[7] = food.x < x  # food left
+    out[8] = food.x > x  # food right
+    out[9] = food.y < y  # food up
+    out[10] = food.y > y  # food down
+    return out
+
+
+def is_collision_batch(grid, x, y):
+    h, w = grid.shape[1:]
+    outside = (x < 0) | (x > w - 1) | (y < 0) | (y > h - 1)
+    hit = grid[np.arange(len(grid)), np.clip(y, 0, h - 1), np.clip(x, 0, w - 1)] == 1
+    return outside | hit
+
+
+# Same features for N games at once from (N, H, W) occupancy grids and per-game head, direction
+# index and food arrays, written into an (N, 11) uint8 buffer.
+def encode_states(grid, head_x, head_y, direction, food_x, food_y, out=None):
+    if out is None:
+        out = np.zeros((len(grid), STATE_SIZE), dtype=np.uint8)
+
+    # danger straight, right, left
+    for i, turn in enumerate((0, 1, -1)):
+        nd = (direction + turn) % 4
+        out[:, i] = is_collision_batch(grid, head_x + DELTA_X[nd], head_y + DELTA_Y[nd])
+
+    # move direction
+    out[:, 3] = direction == LEFT
+    out[:, 4] = direction == RIGHT
+    out[:, 5] = direction == UP
+    out[:, 6] = direction == DOWN
+
+    # food location
+    out[:, 7] = food_x < head_x  # food left
+    out[:, 8] = food_x > head_x  # food right
+    out[:, 9] = food_y < head_y  # food up
+    out[:, 10] = food_y > head_y  # food down
+    return out
+
+
+# Board observation: GRID_CHANNELS x (H + 2) x (W + 2) uint8 planes, the field with a one cell wall border.
+#   head: 255 on the head, body: 255 on the head fading by one per step of age down to 1 (0 = empty),
+#   food: 255 on the food, walls: 255 on the border
+# Body ages come from the step at which each cell was entered ('stamps', 0 = empty), which only changes at the
+# head and the tail, so the per step cost depends on the board size but not on the snake length.
+GRID_CHANNELS = 4
+HEAD = 0
+BODY = 1
+FOOD = 2
+WALL = 3
+
+
+def grid_shape(field_width, field_height):
+    return GRID_CHANNELS, field_height + 2, field_width + 2
+
+
+def encode_grids(stamps, clock, head_x, head_y, food_x, food_y, out=None):
+    # (N, H, W) stamps and per-game clock, head and food arrays -> (N, C, H + 2, W + 2) uint8
+    n, h, w = stamps.shape
+    if out is None:
+        out = np.zeros((n,) + grid_shape(w, h), dtype=np.uint8)
+    envs = np.arange(n)
+
+    out[:, HEAD] = 0
+    out[envs, HEAD, head_y + 1, head_x + 1] = 255  # a head that just left the field lands on the wall border
+
+    age = clock[:, None, None] - stamps
+    np.minimum(age, 254, out=age)
+    out[:, BODY, 1:-1, 1:-1] = np.where(stamps > 0, 255 - age, 0)
+
+    out[:, FOOD] = 0
+    on_field = (food_x >= 0) & (food_x < w) & (food_y >= 0) & (food_y < h)
+    out[envs[on_field], FOOD, food_y[on_field] + 1, food_x[on_field] + 1] = 255
+
+    out[:, WALL] = 255
+    out[:, WALL, 1:-1, 1:-1] = 0
+    return out
+
+
+# Grid observation of one Environment, kept up to date from the moves between calls: the new head cell is
+# stamped and, if the snake did not grow, the old tail cell cleared. Anything else (a new game, a snake that
+# was replaced or several moves between calls) rebuilds the stamps from the body.
+class GridObservation:
+    def __init__(self, field_width, field_height):
+        self.w = field_width
+        self.h = field_height
+        self.shape = grid_shape(field_width, field_height)
+        self.stamps = np.zeros((1, field_height, field_width), dtype=np.int64)
+        self.clock = np.zeros(1, dtype=np.int64)
+        self.head_x = np.zeros(1, dtype=np.int64)
+        self.head_y = np.zeros(1, dtype=np.int64)
+        self.food_x = np.zeros(1, dtype=np.int64)
+        self.food_y = np.zeros(1, dtype=np.int64)
+
+        self.snake = None
+        self.head = None
+        self.tail = None
+        self.length = 0
+
+    def stamp(self, pt, value):
+        if 0 <= pt.x < self.w and 0 <= pt.y < self.h:
+            self.stamps[0, pt.y, pt.x] = value
+
+    def rebuild(self, body):
+        self.stamps[:] = 0
+        self.clock[0] = len(body)
+        for i in range(len(body) - 1, -1, -1):  # tail first, so the newest stamp wins on a shared cell
+            self.stamp(body[i], len(body) - i)
+
+    def encode(self, env, out=None):
+        snake = env.snake
+        body = snake.body
+        grew = len(body) - self.length
+        if snake is self.snake and len(body) > 1 and body[1] == self.head and 0 <= grew <= 1:
+            self.clock[0] += 1
+            if grew == 0:
+                self.stamp(self.tail, 0)
+            self.stamp(body[0], self.clock[0])
+        else:
+            self.rebuild(body)
+        self.snake = snake
+        self.head = body[0]
+        self.tail = body[-1]
+        self.length = len(body)
+
+        if out is None:
+            out = np.zeros(self.shape, dtype=np.uint8)
+        self.head_x[0] = snake.head.x
+        self.head_y[0] = snake.head.y
+        self.food_x[0] = env.food.pt.x
+        self.food_y[0] = env.food.pt.y
+        encode_grids(self.stamps, self.clock, self.head_x, self.head_y, self.food_x, self.food_y, out[None])
+        return out
@@ -0,0 +1,195 @@
+import argparse
+import json
+import os
+import time
+import numpy as np
+import torch
+
+GAMES = 20  # games played per configuration by the end-to-end autotune run
+
+
+# Torch CPU settings for training. Acting and single-transition updates are tiny 11x256 matmuls where thread
+# pool dispatch costs more than it saves, while replay batches are big enough to use several cores, so the
+# intra-op thread count is switched to learn_threads around replay batch updates. None keeps the torch default.
+class PerfConfig:
+    def __init__(self, act_threads=None, learn_threads=None, interop_threads=None, pin_actors=False, compile=False):
+        self.act_threads = act_threads
+        self.learn_threads = learn_threads
+        self.interop_threads = interop_threads
+        self.pin_actors = pin_actors  # one CPU per actor process, the learner gets the others
+        self.compile = compile  # torch.compile the network
+        self.learn_phase = Threads(learn_threads)
+
+    @classmethod
+    def load(cls, file_name):
+        # a file written by the autotune run or save()
+        with open(file_name) as f:
+            return cls(**json.load(f)['config'])
+
+    def save(self, file_name, results=None):
+        with open(file_name, 'w') as f:
+            json.dump({'config': self.to_dict(), 'results': results or []}, f, indent=1)
+
+    def to_dict(self):
+        return {'act_threads': self.act_threads, 'learn_threads': self.learn_threads,
+                'interop_threads': self.interop_threads, 'pin_actors': self.pin_actors, 'compile': self.compile}
+
+    def replace(self, **changes):
+        # copy with some settings changed, None values are ignored
+        fields = self.to_dict()
+        fields.update((name, value) for name, value in changes.items() if value is not None)
+        return PerfConfig(**fields)
+
+    def apply(self):
+        # once per process, before the first torch operation that uses threads
+        if self.interop_threads is not None:
+            try:
+                torch.set_num_interop_threads(self.interop_threads)
+            except RuntimeError:
+                pass  # can only be set once per process
+        if self.act_threads is not None:
+            torch.set_num_threads(self.act_threads)
+
+    def learning(self):
+        # with perf.learning(): replay batch update
+        return self.learn_phase
+
+    def compile_model(self, model):
+        return torch.compile(model) if self.compile else model
+
+
+# reusable context manager switching the intra-op thread count and back
+class Threads:
+    __slots__ = ('threads', 'previous')
+
+    def __init__(self, threads):
+        self.threads = threads
+        self.previous = None
+
+    def __enter__(self):
+        if self.threads is not None:
+            self.previous = torch.get_num_threads()
+            if self.previous != self.threads:
+                torch.set_num_threads(self.threads)
+
+    def __exit__(self, *exc):
+        if self.threads is not None and self.previous != self.threads:
+            torch.set_num_threads(self.previous)
+
+
+def available_cpus():
+    if hasattr(os, 'sched_getaffinity'):
+        return sorted(os.sched_getaffinity(0))
+    return list(range(os.cpu_count()))
+
+
+def actor_cpus(worker_id, n_workers):
+    # actors take the last CPUs, one each
+    cpus = available_cpus()
+    return {cpus[-1 - worker_id % len(cpus)]}
+
+
+def learner_cpus(n_workers):
+    cpus = available_cpus()
+    return set(cpus[:len(cpus) - n_workers] or cpus)
+
+
+def pin(cpus):
+    # no-op where the OS does not support affinity (macOS, Windows)
+    if hasattr(os, 'sched_setaffinity'):
+        os.sched_setaffinity(0, cpus)
+
+
+def thread_counts():
+    n = len(available_cpus())
+    return sorted({1, 2, n // 2, n} & set(range(1, n + 1)))
+
+
+def autotune(games=GAMES, min_time=0.5, compile=False, schedule='classic', seed=0):
+    # Measures the phases at every thread count, then plays a few training games with the fastest acting and
+    # learning settings against the torch defaults. Returns the best config and one result dict per measurement.
+    from agent import Agent, BATCH_SIZE
+    from benchmark import ops_per_sec, seed_all
+
+    default_threads = torch.get_num_threads()
+    results = []
+    compile_modes = (False, True) if compile else (False,)
+    rng = np.random.default_rng(seed)
+    state = rng.integers(0, 2, size=11).astype(np.uint8)
+    states = torch.from_numpy(rng.integers(0, 2, size=(BATCH_SIZE, 11))).float()
+    actions = torch.from_numpy(rng.integers(0, 3, size=BATCH_SIZE))
+    rewards = torch.from_numpy(rng.choice([-10.0, 0.0, 10.0], size=BATCH_SIZE)).float()
+    next_states = torch.from_numpy(rng.integers(0, 2, size=(BATCH_SIZE, 11))).float()
+    dones = rewards == -10
+
+    best_act = {}
+    best_learn = {}
+    for compiled in compile_modes:
+        agent = Agent(render=False, plot=False, verbose=False, save_model=False, perf=PerfConfig(compile=compiled))
+        agent.n_games = 100  # no exploration, every action is a forward pass
+
+        def act():
+            agent.train_short_memory(state, agent.get_action(state), 0.0, state, False)
+
+        def learn():
+            agent.trainer.train_step(states, actions, rewards, next_states, dones)
+
+        act()  # compiles when compiled
+        learn()
+        for threads in thread_counts():
+            torch.set_num_threads(threads)
+            act_speed = ops_per_sec(act, min_time)
+            learn_speed = ops_per_sec(learn, min_time)
+            results.append({'name': 'autotune.act', 'threads': threads, 'compile': compiled, 'ops_per_sec': act_speed})
+            results.append({'name': 'autotune.learn', 'threads': threads, 'compile': compiled, 'batch_size': BATCH_SIZE,
+                            'ops_per_sec': learn_speed})
+            if act_speed > best_act.get(compiled, (0, 0))[1]:
+                best_act[compiled] = (threads, act_speed)
+            if learn_speed > best_learn.get(compiled, (0, 0))[1]:
+                best_learn[compiled] = (threads, learn_speed)
+    torch.set_num_threads(default_threads)
+
+    # end to end: training steps per second with the same seeds
+    configs = [PerfConfig()]
+    for c in compile_modes:
+        configs.append(PerfConfig(act_threads=best_act[c][0], learn_threads=best_learn[c][0], compile=c))
+    best = None
+    best_speed = 0
+    for config in configs:
+        seed_all(seed)
+        agent = Agent(render=False, plot=False, verbose=False, save_model=False, seed=seed, schedule=schedule,
+                      perf=config)
+        start = time.perf_counter()
+        agent.train(max_games=games)
+        speed = agent.metrics.env_steps / (time.perf_counter() - start)
+        torch.set_num_threads(default_threads)
+        results.append({'name': 'autotune.train', 'schedule': schedule, 'games': games, 'config': config.to_dict(),
+                        'steps_per_sec': speed})
+        if speed > best_speed:
+            best = config
+            best_speed = speed
+    return best, results
+
+
+def parse_args(args=None):
+    parser = argparse.ArgumentParser(description='Measure torch thread settings on this machine and save the fastest')
+    parser.add_argument('--output', default='perf.json', help='profile for agent.py --perf-profile')
+    parser.add_argument('--games', type=int, default=GAMES, help='training games per configuration')
+    parser.add_argument('--min-time', type=float, default=0.5, help='seconds per phase measurement')
+    parser.add_argument('--compile', action='store_true', help='also try torch.compile, slow to start')
+    parser.add_argument('--schedule', default='classic', help='update schedule of the training games')
+    parser.add_argument('--seed', type=int, default=0)
+    return parser.parse_args(args)
+
+
+def main(args=None):
+    args = parse_args(args)
+    best, results = autotune(args.games, args.min_time, args.compile, args.schedule, args.seed)
+    for record in results:
+        print(json.dumps(record))
+    print('Best', json.dumps(best.to_dict()))
+    best.save(args.output, results)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,239 @@
+import argparse
+import os
+import time
+import multiprocessing as mp
+import numpy as np
+from environment import Environment
+from observation import STATE_SIZE, DIRECTION_INDEX, DELTA_X, DELTA_Y, encode_state
+from dataset import COLUMNS, chunk_files, next_chunk, write_chunk
+
+N_GAMES = 1000
+GAMES_PER_CHUNK = 20  # games played by one pool task and written as one chunk
+UNREACHABLE = 1 << 30
+
+
+def free_cells(env):
+    # board with a one cell wall border, True where the snake can move
+    free = np.zeros((env.fieldH + 2, env.fieldW + 2), dtype=np.bool_)
+    free[1:-1, 1:-1] = True
+    for pt in env.snake.cells:
+        if 0 <= pt.x < env.fieldW and 0 <= pt.y < env.fieldH:
+            free[pt.y + 1, pt.x + 1] = False
+    return free
+
+
+def spread(frontier, out):
+    # cells next to the frontier, the border of a padded board is never part of it
+    out[:] = False
+    out[1:-1, 1:-1] = frontier[:-2, 1:-1] | frontier[2:, 1:-1] | frontier[1:-1, :-2] | frontier[1:-1, 2:]
+    return out
+
+
+def distance_map(free, x, y, near=None):
+    # Breadth-first steps from board cell (x, y) to the free cells as a NumPy wavefront, -1 where unreachable.
+    # With near=(x, y) it stops once the cells around near have their distances (they differ by 2 at most).
+    dist = np.full(free.shape, -1, dtype=np.int32)
+    seen = np.zeros_like(free)
+    frontier = np.zeros_like(free)
+    grown = np.zeros_like(free)
+    frontier[y + 1, x + 1] = True
+    seen[y + 1, x + 1] = True
+    dist[y + 1, x + 1] = 0
+    around = None
+    if near is not None:
+        nx = near[0] + 1
+        ny = near[1] + 1
+        around = (np.array([ny, ny, ny - 1, ny + 1]), np.array([nx - 1, nx + 1, nx, nx]))
+    d = 0
+    last = -1
+    while frontier.any() and d != last:
+        d += 1
+        spread(frontier, grown)
+        grown &= free
+        grown &= ~seen
+        seen |= grown
+        dist[grown] = d
+        frontier, grown = grown, frontier
+        if last < 0 and around is not None and seen[around].any():
+            last = d + 2
+    return dist
+
+
+def reachable(free, x, y, limit, target=None):
+    # whether limit free cells, or the target cell, can be reached from board cell (x, y)
+    seen = np.zeros_like(free)
+    frontier = np.zeros_like(free)
+    grown = np.zeros_like(free)
+    frontier[y + 1, x + 1] = True
+    seen[y + 1, x + 1] = True
+    count = 0
+    while frontier.any():
+        spread(frontier, grown)
+        grown &= free
+        grown &= ~seen
+        seen |= grown
+        count += int(grown.sum())
+        if count >= limit or (target is not None and seen[target[1] + 1, target[0] + 1]):
+            return True, count
+        frontier, grown = grown, frontier
+    return False, count
+
+
+# Scripted player: takes the move with the shortest path to the food (one distance map from the food per
+# step), unless the snake could not fit into the space left behind the move and could not reach its own tail
+# from there. With no safe move it takes the one with the most room. Strong enough to be a baseline for the
+# learned agents and to generate labelled games for pretraining (dataset.train_offline with a margin).
+class Planner:
+    def get_action(self, env):
+        snake = env.snake
+        head = snake.head
+        food = env.food.pt
+        tail = snake.body[-1]
+        length = len(snake.body)
+        free = free_cells(env)
+        dist = distance_map(free, food.x, food.y, (head.x, head.y))
+        d = DIRECTION_INDEX[snake.direction]
+
+        moves = []
+        for action, turn in enumerate((0, 1, -1)):
+            nd = (d + turn) % 4
+            nx = head.x + int(DELTA_X[nd])
+            ny = head.y + int(DELTA_Y[nd])
+            if not free[ny + 1, nx + 1]:
+                continue  # wall or body, the tail only moves after the collision check
+            steps = int(dist[ny + 1, nx + 1])
+            moves.append((steps if steps >= 0 else UNREACHABLE, action, nx, ny))
+        if not moves:
+            return 0
+        moves.sort()
+
+        best_room = -1
+        fallback = moves[0][1]
+        for steps, action, nx, ny in moves:
+            eats = nx == food.x and ny == food.y
+            after = free.copy()
+            if not eats:
+                after[tail.y + 1, tail.x + 1] = True
+            safe, room = reachable(after, nx, ny, length + 1, None if eats else tail)
+            if safe:
+                return action
+            if room > best_room:
+                best_room = room
+                fallback = action
+        return fallback
+
+
+def play_game(seed, planner=None, columns=None, env=None):
+    # one game with the training rules and food placement seeded per game (like evaluate.py), the transitions
+    # are appended to the lists in columns when given
+    if env is None:
+        env = Environment(render=False)
+    env.reset(seed)
+    if planner is None:
+        planner = Planner()
+    state = encode_state(env)
+    steps = 0
+    done = False
+    while not done:
+        action = planner.get_action(env)
+        reward, done = env.change_all(action)
+        next_state = encode_state(env)
+        if columns is not None:
+            columns['states'].append(state)
+            columns['actions'].append(action)
+            columns['rewards'].append(reward)
+            columns['next_states'].append(next_state)
+            columns['dones'].append(done)
+            columns['steps'].append(steps)
+        state = next_state
+        steps += 1
+    return env.score, steps
+
+
+def record_games(task):
+    # pool task: plays games first_game... and writes them as one chunk, returns their scores and lengths
+    folder, chunk, first_game, n_games, seed = task
+    columns = {name: [] for name in COLUMNS}
+    scores = []
+    lengths = []
+    for game in range(first_game, first_game + n_games):
+        n = len(columns['steps'])
+        score, steps = play_game(seed + game, columns=columns)
+        columns['games'] += [game] * (len(columns['steps']) - n)
+        scores.append(score)
+        lengths.append(steps)
+    if folder is not None:
+        write_chunk(os.path.join(folder, 'chunk-{:06d}.npz'.format(chunk)), {
+            'states': np.array(columns['states'], dtype=np.uint8).reshape(-1, STATE_SIZE),
+            'actions': np.array(columns['actions'], dtype=np.uint8),
+            'rewards': np.array(columns['rewards'], dtype=np.float32),
+            'next_states': np.array(columns['next_states'], dtype=np.uint8).reshape(-1, STATE_SIZE),
+            'dones': np.array(columns['dones'], dtype=np.bool_),
+            'games': np.array(columns['games'], dtype=np.uint32),
+            'steps': np.array(columns['steps'], dtype=np.uint32),
+        })
+    return scores, lengths
+
+
+def generate(folder, n_games=N_GAMES, seed=0, processes=None, games_per_chunk=GAMES_PER_CHUNK):
+    # Plays n_games planner games in a process pool. With a folder they are written as chunks dataset.py reads,
+    # after the chunks already there. Game i is seeded with seed + i. Returns scores, game lengths and seconds.
+    chunk = 0
+    first_game = 0
+    if folder is not None:
+        if not os.path.exists(folder):
+            os.makedirs(folder)
+        chunk, first_game = next_chunk(folder)
+    tasks = []
+    for start in range(0, n_games, games_per_chunk):
+        tasks.append((folder, chunk, first_game + start, min(games_per_chunk, n_games - start), seed))
+        chunk += 1
+
+    start = time.perf_counter()
+    scores = []
+    lengths = []
+    if processes == 1:
+        results = map(record_games, tasks)
+    else:
+        pool = mp.get_context('spawn').Pool(processes)
+        results = pool.imap_unordered(record_games, tasks)
+    for task_scores, task_lengths in results:
+        scores += task_scores
+        lengths += task_lengths
+    if processes != 1:
+        pool.close()
+        pool.join()
+    return np.array(scores), np.array(lengths), time.perf_counter() - start
+
+
+def parse_args(args=None):
+    parser = argparse.ArgumentParser(description='Play snake with the shortest path planner, e.g. to record '
+                                                 'games for pretraining (agent.py --pretrain)')
+    parser.add_argument('--record', metavar='DIR', help='write the games as transition chunks in DIR')
+    parser.add_argument('--games', type=int, default=N_GAMES)
+    parser.add_argument('--seed', type=int, default=0, help='first game seed, game i uses seed + i')
+    parser.add_argument('--processes', type=int, default=os.cpu_count(), help='worker processes, 1 = no pool')
+    parser.add_argument('--render', action='store_true', help='watch the games instead')
+    return parser.parse_args(args)
+
+
+def main(args=None):
+    args = parse_args(args)
+    if args.render:
+        env = Environment(render=True)
+        for game in range(args.games):
+            score, steps = play_game(args.seed + game, env=env)
+            print('Game', game + 1, 'Score', score, 'Steps', steps)
+        return
+
+    scores, lengths, seconds = generate(args.record, args.games, args.seed, args.processes)
+    print('Games', len(scores), 'Mean', round(float(scores.mean()), 2), 'Min', scores.min(), 'Max', scores.max(),
+          'Mean game length', round(float(lengths.mean()), 1))
+    print('Transitions', int(lengths.sum()), 'Seconds', round(seconds, 1),
+          'Steps/sec', round(float(lengths.sum() / seconds)))
+    if args.record is not None:
+        print('Chunks', len(chunk_files(args.record)), 'in', args.record)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,124 @@
+import atexit
+import math
+import queue
+import time
+import multiprocessing as mp
+
+REDRAW_INTERVAL = 1.0  # seconds between redraws of the live plot
+MAX_POINTS = 1000  # longer histories are downsampled before drawing
+
+
+def plot(scores, mean_scores):
+    # matplotlib and IPython are only imported when something is actually drawn
+    import matplotlib.pyplot as plt
+    from IPython import display
+
+    plt.ion()
+    display.clear_output(wait=True)
+    display.display(plt.gcf())
+    draw(plt, scores, mean_scores)
+    plt.pause(.1)
+
+
+def draw(plt, scores, mean_scores, games=None):
+    if games is None:
+        games = range(len(scores))
+    plt.clf()
+    plt.title('Training...')
+    plt.xlabel('Number of Games')
+    plt.ylabel('Score')
+    plt.plot(games, scores)
+    plt.plot(games, mean_scores)
+    plt.ylim(ymin=0)
+    plt.text(games[-1], scores[-1], str(scores[-1]))
+    plt.text(games[-1], mean_scores[-1], str(mean_scores[-1]))
+    plt.show(block=False)
+
+
+def downsample(values, max_points=MAX_POINTS):
+    # every n-th game plus the last one, as (game indices, values)
+    step = max(1, math.ceil(len(values) / max_points))
+    games = list(range(0, len(values), step))
+    if games[-1] != len(values) - 1:
+        games.append(len(values) - 1)
+    return games, [values[i] for i in games]
+
+
+# Plots and/or logs scores from a background process, so the training loop only pays for a queue put.
+# With gui=False nothing is drawn and matplotlib is never imported, scores just go to file_name as CSV.
+# close() waits until everything queued is drawn and written, it also runs at exit.
+class Plotter:
+    def __init__(self, gui=True, file_name=None, interval=REDRAW_INTERVAL, max_points=MAX_POINTS):
+        ctx = mp.get_context('spawn')
+        self.queue = ctx.Queue()
+        self.process = ctx.Process(target=plot_worker, daemon=True,
+                                   args=(self.queue, gui, file_name, interval, max_points))
+        self.process.start()
+        atexit.register(self.close)
+
+    def add(self, score, mean_score):
+        self.queue.put((score, mean_score))
+
+    def add_history(self, scores, mean_scores):
+        # games from before a resume: plotted, but already in the CSV file
+        self.queue.put([list(scores), list(mean_scores)])
+
+    def close(self):
+        atexit.unregister(self.close)
+        if self.process.is_alive():
+            self.queue.put(None)
+            self.process.join()
+
+
+def plot_worker(scores_queue, gui, file_name, interval, max_points):
+    plt = None
+    if gui:
+        import matplotlib.pyplot as plt
+        plt.ion()
+    metrics_file = None
+    if file_name is not None:
+        metrics_file = open(file_name, 'a', buffering=1)
+        if metrics_file.tell() == 0:
+            metrics_file.write('game,score,mean_score\n')
+
+    scores = []
+    mean_scores = []
+    last_draw = 0
+    dirty = False
+    running = True
+    while running:
+        # wait for the next game, then take everything else that is already queued
+        items = []
+        try:
+            items.append(scores_queue.get(timeout=interval))
+            while True:
+                items.append(scores_queue.get_nowait())
+        except queue.Empty:
+            pass
+
+        for item in items:
+            if item is None:
+                running = False
+                break
+            if isinstance(item, list):
+                scores.extend(item[0])
+                mean_scores.extend(item[1])
+                dirty = True
+                continue
+            score, mean_score = item
+            scores.append(score)
+            mean_scores.append(mean_score)
+            dirty = True
+            if metrics_file is not None:
+                metrics_file.write('{},{},{}\n'.format(len(scores), score, mean_score))
+
+        if plt is not None:
+            if dirty and (time.monotonic() - last_draw >= interval or not running):
+                games, sampled_scores = downsample(scores, max_points)
+                draw(plt, sampled_scores, [mean_scores[i] for i in games], games)
+                last_draw = time.monotonic()
+                dirty = False
+            plt.pause(0.001)  # let the window handle its events
+
+    if metrics_file is not None:
+        metrics_file.close()
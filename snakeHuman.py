@@ -1,3 +1,4 @@
+import argparse
 import pygame
 import random
 from enum import Enum
@@ -135,9 +136,61 @@ class SnakeGame:
             
         head = Point(x, y)
         self.snake.insert(0, head)
-            
+
+
+# arrow keys as indices into environment.CLOCK_WISE, and the relative action for each clockwise difference
+# between the wanted and the current direction (turning back is not possible, the snake keeps going straight)
+KEY_DIRECTIONS = {pygame.K_RIGHT: 0, pygame.K_DOWN: 1, pygame.K_LEFT: 2, pygame.K_UP: 3}
+TURN_ACTIONS = (0, 1, 0, 2)
+
+
+# Plays with the training Environment and its rules (including the time limit per snake length), so the
+# recorded transitions have the agent's states and actions and can be used by dataset.py like agent games.
+def play_recorded(folder, n_games=1):
+    import numpy as np
+    from environment import Environment, CLOCK_WISE
+    from observation import STATE_SIZE, encode_state
+    from dataset import TransitionRecorder
+
+    env = Environment(speed=SPEED)
+    recorder = TransitionRecorder(folder)
+    state = np.zeros(STATE_SIZE, dtype=np.uint8)
+    next_state = np.zeros(STATE_SIZE, dtype=np.uint8)
+    for game in range(n_games):
+        env.reset()
+        encode_state(env, state)
+        wanted = CLOCK_WISE.index(env.snake.direction)
+        step = 0
+        done = False
+        while not done:
+            for event in pygame.event.get():
+                if event.type == pygame.QUIT:
+                    recorder.close()
+                    pygame.quit()
+                    quit()
+                if event.type == pygame.KEYDOWN and event.key in KEY_DIRECTIONS:
+                    wanted = KEY_DIRECTIONS[event.key]
+
+            action = TURN_ACTIONS[(wanted - CLOCK_WISE.index(env.snake.direction)) % 4]
+            reward, done = env.change_all(action)
+            encode_state(env, next_state)
+            recorder.add(state, action, reward, next_state, done, game, step)
+            state, next_state = next_state, state
+            step += 1
+        print('Game', game + 1, 'Score', env.score)
+    recorder.close()
+
 
 if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Play snake with the arrow keys')
+    parser.add_argument('--record', metavar='DIR', help='record the games as transitions in DIR for dataset.py')
+    parser.add_argument('--games', type=int, default=1, help='games to play when recording')
+    args = parser.parse_args()
+    if args.record is not None:
+        play_recorded(args.record, args.games)
+        pygame.quit()
+        quit()
+
     game = SnakeGame()
     
     # game loop
@@ -0,0 +1,245 @@
+import argparse
+import csv
+import itertools
+import json
+import math
+import os
+import queue
+import time
+import multiprocessing as mp
+import numpy as np
+
+MAX_GAMES = 500
+MIN_GAMES = 50  # first rung
+ETA = 3  # keep the best 1 / ETA of the runs at every rung
+WINDOW = 50  # games averaged for the score of a run
+
+# search space names that are Agent keyword arguments, the others change the update schedule
+AGENT_PARAMS = ('lr', 'gamma', 'hidden_size', 'epsilon_games', 'replay_capacity', 'target_sync', 'tau', 'double',
+                'prioritized', 'observation')
+SCHEDULE_PARAMS = ('batch_size', 'train_every', 'updates_per_step', 'warmup')
+
+
+def parse_value(text):
+    for kind in (int, float):
+        try:
+            return kind(text)
+        except ValueError:
+            pass
+    if text in ('true', 'false'):
+        return text == 'true'
+    return text
+
+
+def parse_space(specs):
+    # name=a,b,c is a choice, name=lo:hi a uniform range and name=log:lo:hi a log-uniform one (ints stay ints)
+    space = {}
+    for spec in specs:
+        name, _, values = spec.partition('=')
+        if name not in AGENT_PARAMS + SCHEDULE_PARAMS + ('schedule',):
+            raise ValueError('unknown parameter {!r}'.format(name))
+        parts = values.split(':')
+        if len(parts) == 3 and parts[0] == 'log':
+            space[name] = ('log', parse_value(parts[1]), parse_value(parts[2]))
+        elif len(parts) == 2:
+            space[name] = ('uniform', parse_value(parts[0]), parse_value(parts[1]))
+        else:
+            space[name] = ('choice', [parse_value(v) for v in values.split(',')])
+    return space
+
+
+def grid(space):
+    for name, dimension in space.items():
+        if dimension[0] != 'choice':
+            raise ValueError('grid search needs lists of values, {} is a range'.format(name))
+    names = list(space)
+    for values in itertools.product(*(space[name][1] for name in names)):
+        yield dict(zip(names, values))
+
+
+def sample(space, n, rng):
+    for _ in range(n):
+        params = {}
+        for name, dimension in space.items():
+            if dimension[0] == 'choice':
+                value = dimension[1][rng.integers(len(dimension[1]))]
+            else:
+                lo, hi = dimension[1:]
+                if dimension[0] == 'log':
+                    value = math.exp(rng.uniform(math.log(lo), math.log(hi)))
+                else:
+                    value = rng.uniform(lo, hi)
+                if isinstance(lo, int) and isinstance(hi, int):
+                    value = int(round(value))
+            params[name] = value
+        yield params
+
+
+def agent_kwargs(params):
+    from agent import SCHEDULES
+    kwargs = {name: value for name, value in params.items() if name in AGENT_PARAMS}
+    schedule = SCHEDULES[params.get('schedule', 'classic')]
+    kwargs['schedule'] = schedule.replace(**{name: value for name, value in params.items() if name in SCHEDULE_PARAMS})
+    return kwargs
+
+
+def run_trial(run_id, params, max_games, seed, scores, stops):
+    # one headless training run in a pool process, every game's score goes back to the sweep as it ends
+    import random
+    import torch
+    from agent import Agent
+    torch.set_num_threads(1)
+    random.seed(seed)
+    np.random.seed(seed)
+    torch.manual_seed(seed)
+
+    agent = Agent(render=False, plot=False, verbose=False, save_model=False, seed=seed, **agent_kwargs(params))
+    start = time.perf_counter()
+
+    def stop(a):
+        scores.put((run_id, a.n_games, a.plot_scores[-1]))
+        return stops.get(run_id, False)
+
+    agent.train(max_games=max_games, stop=stop)
+    return run_id, agent.n_games, time.perf_counter() - start, agent.metrics.env_steps
+
+
+# Asynchronous successive halving: the rungs are MIN_GAMES * ETA^k games, and a run that reaches a rung with
+# a score below the best 1 / ETA of all runs that reached it before is stopped. Runs never wait for each other.
+class SuccessiveHalving:
+    def __init__(self, min_games=MIN_GAMES, eta=ETA, max_games=MAX_GAMES):
+        self.eta = eta
+        self.rungs = []
+        games = min_games
+        while games < max_games:
+            self.rungs.append(games)
+            games *= eta
+        self.rung_scores = {games: [] for games in self.rungs}
+
+    def should_stop(self, games, score):
+        # called once per run and rung
+        scores = self.rung_scores[games]
+        scores.append(score)
+        keep = len(scores) // self.eta
+        if keep == 0:
+            return False  # too few runs at this rung to compare
+        return score < sorted(scores, reverse=True)[keep - 1]
+
+
+def sweep(configs, max_games=MAX_GAMES, processes=None, min_games=MIN_GAMES, eta=ETA, window=WINDOW, seed=0,
+          verbose=True):
+    halving = SuccessiveHalving(min_games, eta, max_games)
+    ctx = mp.get_context('spawn')
+    manager = ctx.Manager()
+    scores = manager.Queue()
+    stops = manager.dict()
+
+    runs = [{'run': i, 'params': params, 'scores': [], 'stopped_at': None, 'games': 0, 'seconds': 0.0,
+             'steps_per_sec': 0.0, 'error': None} for i, params in enumerate(configs)]
+    try:
+        with ctx.Pool(processes or os.cpu_count()) as pool:
+            pending = [pool.apply_async(run_trial, (run['run'], run['params'], max_games, seed + run['run'], scores,
+                                                    stops)) for run in runs]
+            finished = 0
+            while finished < len(runs):
+                try:
+                    run_id, games, score = scores.get(timeout=0.5)
+                except queue.Empty:
+                    finished = sum(result.ready() for result in pending)
+                    continue
+                run = runs[run_id]
+                run['scores'].append(score)
+                if games in halving.rung_scores and run['stopped_at'] is None:
+                    if halving.should_stop(games, float(np.mean(run['scores'][-window:]))):
+                        run['stopped_at'] = games
+                        stops[run_id] = True
+                        if verbose:
+                            print('Stopped run', run_id, 'after', games, 'games')
+
+            for run, result in zip(runs, pending):
+                try:
+                    _, games, seconds, steps = result.get()
+                except Exception as e:
+                    # a failed run (bad parameters, out of memory, a dead worker) does not end the sweep
+                    run['error'] = '{}: {}'.format(type(e).__name__, e)
+                    if verbose:
+                        print('Run', run['run'], 'failed:', run['error'])
+                    continue
+                run.update(games=games, seconds=seconds, steps_per_sec=steps / seconds)
+            # scores still in flight
+            while True:
+                try:
+                    run_id, games, score = scores.get_nowait()
+                except queue.Empty:
+                    break
+                runs[run_id]['scores'].append(score)
+    finally:
+        manager.shutdown()
+
+    for run in runs:
+        run['record'] = max(run['scores'], default=0)
+        if run['error'] is not None:
+            run['mean_score'] = None
+        else:
+            run['mean_score'] = float(np.mean(run['scores'][-window:])) if run['scores'] else 0.0
+    # completed runs first, then by games played and mean score, failed runs last
+    return sorted(runs, key=lambda r: (r['error'] is None, r['stopped_at'] is None, r['games'], r['mean_score'] or 0),
+                  reverse=True)
+
+
+def write_table(runs, file_name):
+    names = sorted({name for run in runs for name in run['params']})
+    with open(file_name, 'w', newline='') as f:
+        writer = csv.writer(f)
+        writer.writerow(['run'] + names + ['games', 'stopped_at', 'mean_score', 'record', 'seconds', 'steps_per_sec',
+                                           'error'])
+        for run in runs:
+            mean_score = None if run['mean_score'] is None else round(run['mean_score'], 3)
+            writer.writerow([run['run']] + [run['params'].get(name) for name in names] +
+                            [run['games'], run['stopped_at'], mean_score, run['record'],
+                             round(run['seconds'], 1), round(run['steps_per_sec']), run['error']])
+
+
+def print_table(runs):
+    for run in runs:
+        if run['error'] is not None:
+            print('{:>4} failed {} {}'.format(run['run'], run['error'], json.dumps(run['params'])))
+            continue
+        print('{:>4} games {:>5} mean {:>7.2f} record {:>4} {:>7.1f}s {}'.format(
+            run['run'], run['games'], run['mean_score'], run['record'], run['seconds'], json.dumps(run['params'])))
+
+
+def parse_args(args=None):
+    parser = argparse.ArgumentParser(
+        description='Headless training runs over a search space in parallel, stopping weak runs early',
+        epilog='parameters: {}, schedule. e.g. lr=log:0.0001:0.01 gamma=0.8,0.9,0.95 hidden_size=64,256'.format(
+            ', '.join(AGENT_PARAMS + SCHEDULE_PARAMS)))
+    parser.add_argument('space', nargs='+', help='name=a,b,c (values), name=lo:hi or name=log:lo:hi (ranges)')
+    parser.add_argument('--random', type=int, help='sample this many configurations instead of the full grid')
+    parser.add_argument('--max-games', type=int, default=MAX_GAMES, help='games of a run that is never stopped')
+    parser.add_argument('--min-games', type=int, default=MIN_GAMES, help='games before the first early stop')
+    parser.add_argument('--eta', type=int, default=ETA, help='keep the best 1/eta at every rung')
+    parser.add_argument('--window', type=int, default=WINDOW, help='games averaged for the score of a run')
+    parser.add_argument('--processes', type=int, default=os.cpu_count())
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--output', default='sweep.csv', help='results table')
+    return parser.parse_args(args)
+
+
+def main(args=None):
+    args = parse_args(args)
+    space = parse_space(args.space)
+    if args.random:
+        configs = list(sample(space, args.random, np.random.default_rng(args.seed)))
+    else:
+        configs = list(grid(space))
+    print('Runs', len(configs), 'Processes', args.processes, 'Rungs',
+          SuccessiveHalving(args.min_games, args.eta, args.max_games).rungs)
+
+    runs = sweep(configs, args.max_games, args.processes, args.min_games, args.eta, args.window, args.seed)
+    print_table(runs)
+    write_table(runs, args.output)
+
+
+if __name__ == '__main__':
+    main()
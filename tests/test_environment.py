@@ -0,0 +1,42 @@
+import random
+from environment import Snake, Food, Point, CLOCK_WISE, TURN, Direction
+
+STEP = {Direction.RIGHT: (1, 0), Direction.LEFT: (-1, 0), Direction.DOWN: (0, 1), Direction.UP: (0, -1)}
+
+
+def check_cells(snake, w, h):
+    field = {Point(x, y) for y in range(h) for x in range(w)}
+    on_field = {pt for pt in snake.cells if pt in field}
+    assert len(snake.free) == len(set(snake.free))
+    assert set(snake.free) | on_field == field
+    assert not set(snake.free) & on_field
+    assert all(snake.free[i] == pt for pt, i in snake.free_idx.items())
+    assert len(snake.free_idx) == len(snake.free)
+
+
+def test_free_cells_with_body_starting_off_field():
+    # the body starts at x = -2 and -1, outside the field, and the snake grows now and then
+    w, h = 8, 6
+    rng = random.Random(0)
+    snake = Snake(0, 2, w, h)
+    food = Food(w, h, 0, 0, random.Random(1))
+    check_cells(snake, w, h)
+    for step in range(300):
+        # moves that keep the head on the field and off the body
+        moves = []
+        for action in range(3):
+            d = CLOCK_WISE[(CLOCK_WISE.index(snake.direction) + TURN[action]) % 4]
+            pt = Point(snake.head.x + STEP[d][0], snake.head.y + STEP[d][1])
+            if 0 <= pt.x < w and 0 <= pt.y < h and (pt not in snake.cells or pt == snake.body[-1]):
+                moves.append(action)
+        if not moves:
+            break
+        snake.move(rng.choice(moves))
+        if len(snake.body) > 8 or rng.random() < 0.8:
+            snake.pop_tail()
+        check_cells(snake, w, h)
+        food.place_food(snake.free)
+        assert 0 <= food.pt.x < w and 0 <= food.pt.y < h
+        assert food.pt not in snake.cells
+    assert step > 50
+    assert all(0 <= pt.x < w for pt in snake.body)  # the off-field cells were all popped
@@ -0,0 +1,20 @@
+import numpy as np
+import torch
+from export import export
+from inference import NumpyQNet, TorchScriptQNet, load_policy
+from model import LinearQNet
+
+
+def test_exported_nets_match_eager(tmp_path):
+    torch.manual_seed(0)
+    net = LinearQNet(11, 256, 3)
+    states = np.random.default_rng(0).integers(0, 2, size=(500, 11)).astype(np.uint8)
+    with torch.no_grad():
+        expected = net(torch.as_tensor(states, dtype=torch.float)).numpy()
+
+    torchscript_file, numpy_file = export(net, str(tmp_path / 'model'), ['torchscript', 'numpy'])
+    for policy in (TorchScriptQNet(torchscript_file), NumpyQNet.load(numpy_file), load_policy(numpy_file)):
+        assert np.allclose(policy.forward(states), expected, atol=1e-5)
+        assert np.array_equal(policy.get_actions(states), expected.argmax(axis=1))
+        # a single state as a batch of one
+        assert np.array_equal(policy.get_actions(states[:1]), expected[:1].argmax(axis=1))
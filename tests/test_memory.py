@@ -0,0 +1,148 @@
+import numpy as np
+import pytest
+import torch
+from checkpoint import write_checkpoint, read_checkpoint
+from memory import ReplayBuffer, MappedReplayBuffer, SumTree, NStepWindow
+
+
+def random_transitions(rng, n, state_size=11):
+    return (rng.integers(0, 2, size=(n, state_size)).astype(np.uint8),
+            rng.integers(0, 3, size=n).astype(np.uint8),
+            rng.choice(np.array([-10, 0, 10], dtype=np.float32), size=n),
+            rng.integers(0, 2, size=(n, state_size)).astype(np.uint8),
+            rng.random(n) < 0.1)
+
+
+def assert_batches_equal(a, b):
+    assert len(a) == len(b)
+    for x, y in zip(a, b):
+        assert torch.equal(x, y)
+
+
+def test_sum_tree_total_and_find():
+    rng = np.random.default_rng(0)
+    priorities = rng.random(13)
+    tree = SumTree(len(priorities))
+    tree.update(np.arange(8), priorities[:8])
+    for i in range(8, len(priorities)):
+        tree.set(i, priorities[i])
+    assert tree.total() == pytest.approx(priorities.sum())
+    assert np.allclose(tree.get(np.arange(len(priorities))), priorities)
+
+    # a value falls on the leaf whose prefix-sum interval contains it
+    bounds = np.cumsum(priorities)
+    values = rng.uniform(0, tree.total(), size=1000)
+    assert np.array_equal(tree.find(values), np.searchsorted(bounds, values))
+
+
+def test_sum_tree_proportional_sampling():
+    tree = SumTree(4)
+    tree.update(np.arange(4), [1.0, 0.0, 3.0, 0.0])
+    leaves = tree.find(np.random.default_rng(1).uniform(0, tree.total(), size=40000))
+    assert not np.isin(leaves, (1, 3)).any()
+    assert np.mean(leaves == 2) == pytest.approx(0.75, abs=0.01)
+
+
+def test_mapped_buffer_round_trip(tmp_path):
+    rng = np.random.default_rng(2)
+    memory = MappedReplayBuffer(str(tmp_path / 'replay.dat'), 64, seed=0)
+    states, actions, rewards, next_states, dones = random_transitions(rng, 100)
+    memory.push(states[0], actions[0], rewards[0], next_states[0], dones[0])
+    memory.push_batch(states[1:], actions[1:], rewards[1:], next_states[1:], dones[1:])
+    assert len(memory) == 64
+
+    # the ring holds the last 64 transitions, written on from slot 1 after the single push
+    idx = np.arange(64)
+    kept = 36 + (idx - 1) % 64
+    batch = memory.get(idx)
+    assert np.array_equal(batch[0].numpy(), states[kept])
+    assert np.array_equal(batch[1].numpy(), actions[kept])
+    assert np.array_equal(batch[2].numpy(), rewards[kept])
+    assert np.array_equal(batch[3].numpy(), next_states[kept])
+    assert np.array_equal(batch[4].numpy(), dones[kept])
+    memory.close()
+
+
+def test_mapped_buffer_resume(tmp_path):
+    rng = np.random.default_rng(6)
+    memory = MappedReplayBuffer(str(tmp_path / 'replay.dat'), 40, seed=7)
+    memory.push_batch(*random_transitions(rng, 30))
+    arrays, info = memory.snapshot()
+    write_checkpoint(str(tmp_path / 'checkpoints'), 'game-0000001', {'replay-records.npy': arrays['records']})
+    expected = memory.get(np.arange(30))
+
+    # training goes on and overwrites the file before the resume
+    memory.push_batch(*random_transitions(rng, 40))
+    memory.restore({'records': read_checkpoint(str(tmp_path / 'checkpoints'))['replay-records.npy']}, info)
+    assert (memory.pos, memory.size) == (30, 30)
+    assert_batches_equal(memory.get(np.arange(30)), expected)
+    memory.close()
+
+
+@pytest.mark.parametrize('discounts', [False, True])
+def test_replay_buffer_resume(tmp_path, discounts):
+    rng = np.random.default_rng(3)
+    memory = ReplayBuffer(50, seed=4, discounts=discounts)
+    transitions = random_transitions(rng, 70)
+    memory.push_batch(*transitions, discounts=rng.random(70).astype(np.float32) if discounts else None)
+
+    arrays, info = memory.snapshot()
+    files = {'replay-{}.npy'.format(name): array for name, array in arrays.items()}
+    files['state.pkl'] = info
+    write_checkpoint(str(tmp_path), 'game-0000001', files)
+
+    files = read_checkpoint(str(tmp_path))
+    resumed = ReplayBuffer(50, seed=5, discounts=discounts)
+    resumed.restore({file_name[len('replay-'):-len('.npy')]: array
+                     for file_name, array in files.items() if file_name.startswith('replay-')}, files['state.pkl'])
+    assert (resumed.pos, resumed.size) == (memory.pos, memory.size)
+    for name in memory.fields:
+        assert np.array_equal(getattr(resumed, name), getattr(memory, name))
+    # the sampling RNG goes on where it was
+    for _ in range(3):
+        assert_batches_equal(resumed.sample(16), memory.sample(16))
+
+
+def test_replay_buffer_resume_discounts_mismatch():
+    memory = ReplayBuffer(10, discounts=True)
+    with pytest.raises(ValueError):
+        ReplayBuffer(10).restore(*memory.snapshot())
+
+
+def test_mapped_buffer_snapshots_copy_new_slots(tmp_path):
+    rng = np.random.default_rng(8)
+    memory = MappedReplayBuffer(str(tmp_path / 'replay.dat'), 50, seed=9)
+    folder = str(tmp_path / 'checkpoints')
+    expected = []
+    for i, n in enumerate((30, 35, 5, 0, 120)):
+        memory.push_batch(*random_transitions(rng, n))
+        arrays, info = memory.snapshot()
+        assert arrays['records'].tobytes() == memory.data[:memory.size].tobytes()
+        write_checkpoint(folder, 'game-{:07d}'.format(i), {'replay-records.npy': arrays['records']}, keep=5)
+        expected.append((info, memory.get(np.arange(memory.size))))
+
+    # every checkpoint still restores to its own records, not the latest ones
+    for i, (info, batch) in enumerate(expected):
+        memory.restore({'records': read_checkpoint(folder, 'game-{:07d}'.format(i))['replay-records.npy']}, info)
+        assert_batches_equal(memory.get(np.arange(memory.size)), batch)
+    memory.close()
+
+
+def test_n_step_window():
+    # a game of 5 moves with rewards 1..5, state t is all t
+    memory = ReplayBuffer(20, discounts=True)
+    window = NStepWindow(3, 0.5)
+    states = [np.full(11, t, dtype=np.uint8) for t in range(6)]
+    for t in range(5):
+        window.push(memory, states[t], t % 3, t + 1.0, states[t + 1], t == 4)
+    assert len(window) == 0
+    assert len(memory) == 5
+
+    states, actions, rewards, next_states, dones, discounts = memory.get(np.arange(5))
+    assert states[:, 0].tolist() == [0, 1, 2, 3, 4]
+    assert actions.tolist() == [0, 1, 2, 0, 1]
+    assert rewards.tolist() == [2.75, 4.5, 6.25, 6.5, 5.0]
+    # bootstrapped from 3 moves ahead with gamma^3, the last 3 end with the game and have nothing to bootstrap
+    assert next_states[:, 0].tolist() == [3, 4, 5, 5, 5]
+    assert dones.tolist() == [False, False, True, True, True]
+    assert discounts.tolist() == [0.125, 0.125, 0.0, 0.0, 0.0]
@@ -0,0 +1,24 @@
+import numpy as np
+from environment import Environment
+from observation import GridObservation
+
+
+def test_grid_observation_matches_fresh_encode():
+    # the incrementally updated grid equals one built from scratch after every move, across games
+    env = Environment(render=False, seed=0)
+    rng = np.random.default_rng(0)
+    observation = GridObservation(env.fieldW, env.fieldH)
+    games = 0
+    steps = 0
+    while games < 5:
+        grid = observation.encode(env)
+        fresh = GridObservation(env.fieldW, env.fieldH).encode(env)
+        assert np.array_equal(grid, fresh), 'game {} step {}'.format(games, steps)
+        _, done = env.change_all(int(rng.integers(0, 3)))
+        steps += 1
+        if done:
+            grid = observation.encode(env)
+            assert np.array_equal(grid, GridObservation(env.fieldW, env.fieldH).encode(env))
+            env.reset()
+            games += 1
+    assert steps > 50
@@ -0,0 +1,208 @@
+import argparse
+import atexit
+import collections
+import os
+import struct
+import time
+import numpy as np
+from environment import Environment
+
+# File layout: MAGIC, VERSION and the board size in cells, then one record per game: game number, game seed,
+# steps and score as uint32, followed by the actions packed 4 to a byte (2 bits each, first action in the low
+# bits). A game of n steps takes 16 + ceil(n / 4) bytes. Like recorded transitions (dataset.py), game numbers
+# go on from the last game in the file, training prints them as "Trace N".
+MAGIC = b'SNKT'
+VERSION = 1
+FILE_HEADER = struct.Struct('<4sBHH')
+GAME_HEADER = struct.Struct('<IIII')
+BUFFER_SIZE = 1 << 20
+
+Trace = collections.namedtuple('Trace', 'game, seed, steps, score, actions')
+
+
+def pack_actions(actions):
+    actions = np.asarray(actions, dtype=np.uint8)
+    padded = np.zeros(-(-len(actions) // 4) * 4, dtype=np.uint8)
+    padded[:len(actions)] = actions
+    return (padded[0::4] | padded[1::4] << 2 | padded[2::4] << 4 | padded[3::4] << 6).tobytes()
+
+
+def unpack_actions(data, steps):
+    packed = np.frombuffer(data, dtype=np.uint8)
+    actions = np.empty((len(packed), 4), dtype=np.uint8)
+    for i in range(4):
+        actions[:, i] = (packed >> (2 * i)) & 3
+    return actions.reshape(-1)[:steps]
+
+
+# Appends the games of an Environment to a trace file: add() every action, end_game() when the game is over.
+# The file is written through a large buffer and kept when training is interrupted. end_game() numbers games
+# from first_game, the game after the last one already in the file.
+class TraceWriter:
+    def __init__(self, file_name, field_width, field_height):
+        if os.path.exists(file_name) and os.path.getsize(file_name) > 0:
+            with open(file_name, 'rb') as f:
+                header = read_header(f)
+            if header != (field_width, field_height):
+                raise ValueError('{} has traces of a {}x{} board, not {}x{}'.format(
+                    file_name, header[0], header[1], field_width, field_height))
+            self.first_game = 0
+            for _, trace in TraceReader(file_name).games(actions=False):
+                self.first_game = trace.game + 1
+            self.file = open(file_name, 'ab', buffering=BUFFER_SIZE)
+        else:
+            self.first_game = 0
+            self.file = open(file_name, 'wb', buffering=BUFFER_SIZE)
+            self.file.write(FILE_HEADER.pack(MAGIC, VERSION, field_width, field_height))
+        self.actions = bytearray()
+        atexit.register(self.close)
+
+    def add(self, action):
+        self.actions.append(action)
+
+    def end_game(self, game, seed, score):
+        # returns the number game is saved under
+        game += self.first_game
+        self.file.write(GAME_HEADER.pack(game, seed, len(self.actions), score))
+        self.file.write(pack_actions(self.actions))
+        self.actions = bytearray()
+        return game
+
+    def flush(self):
+        self.file.flush()
+
+    def truncate(self, game):
+        # drops the saved game number game and everything after it, for a resume from a checkpoint
+        self.file.flush()
+        for offset, trace in TraceReader(self.file.name).games(actions=False):
+            if trace.game >= game:
+                self.file.truncate(offset)
+                break
+
+    def close(self):
+        if not self.file.closed:
+            self.file.close()
+        atexit.unregister(self.close)
+
+
+def read_header(f):
+    magic, version, width, height = FILE_HEADER.unpack(f.read(FILE_HEADER.size))
+    if magic != MAGIC or version != VERSION:
+        raise ValueError('not a version {} trace file'.format(VERSION))
+    return width, height
+
+
+class TraceReader:
+    def __init__(self, file_name):
+        self.file_name = file_name
+        with open(file_name, 'rb') as f:
+            self.width, self.height = read_header(f)
+
+    def games(self, actions=True, start=FILE_HEADER.size):
+        # every game as a Trace with its file offset, the actions are skipped with actions=False
+        with open(self.file_name, 'rb', buffering=BUFFER_SIZE) as f:
+            f.seek(start)
+            offset = start
+            while True:
+                header = f.read(GAME_HEADER.size)
+                if len(header) < GAME_HEADER.size:
+                    return  # end of file, or a game cut off by a crash
+                game, seed, steps, score = GAME_HEADER.unpack(header)
+                n_bytes = -(-steps // 4)
+                if actions:
+                    data = f.read(n_bytes)
+                    if len(data) < n_bytes:
+                        return
+                    yield offset, Trace(game, seed, steps, score, unpack_actions(data, steps))
+                else:
+                    f.seek(n_bytes, os.SEEK_CUR)
+                    yield offset, Trace(game, seed, steps, score, None)
+                offset += GAME_HEADER.size + n_bytes
+
+    def __iter__(self):
+        for _, trace in self.games():
+            yield trace
+
+    def find(self, game=None):
+        # the trace of game number game (its last copy, should the file hold it twice), or of the first game with
+        # the best score
+        found = None
+        best = -1
+        for offset, trace in self.games(actions=False):
+            if trace.game == game or (game is None and trace.score > best):
+                found = offset
+                best = trace.score
+        if found is None:
+            raise ValueError('no game {} in {}'.format(game, self.file_name))
+        for _, trace in self.games(start=found):
+            return trace
+        raise ValueError('game {} in {} is cut off'.format(game, self.file_name))
+
+    def environment(self, render=False, speed=None):
+        # an Environment with the board of the traces
+        env = Environment(self.width * 20, self.height * 20, render=render)
+        if speed is not None:
+            env.speed = speed
+        return env
+
+
+def replay(env, trace):
+    # plays the game again in env (rendered or not), returns the score and whether it matches the trace
+    env.reset(trace.seed)
+    done = False
+    steps = 0
+    for action in trace.actions.tolist():
+        if done:
+            break
+        _, done = env.change_all(action)
+        steps += 1
+    return env.score, done and steps == trace.steps and env.score == trace.score
+
+
+def parse_args(args=None):
+    parser = argparse.ArgumentParser(description='Summarize, verify or watch games recorded with agent.py --trace')
+    parser.add_argument('file')
+    parser.add_argument('--game', type=int, help='watch this game number ("Trace N" in the training output)')
+    parser.add_argument('--best', action='store_true', help='watch the game with the highest score')
+    parser.add_argument('--speed', type=int, default=20, help='frames per second when watching')
+    parser.add_argument('--verify', action='store_true', help='replay every game headless and check its score')
+    return parser.parse_args(args)
+
+
+def main(args=None):
+    args = parse_args(args)
+    reader = TraceReader(args.file)
+    if args.game is not None or args.best:
+        trace = reader.find(args.game)
+        print('Game', trace.game, 'Seed', trace.seed, 'Steps', trace.steps, 'Score', trace.score)
+        score, ok = replay(reader.environment(render=True, speed=args.speed), trace)
+        print('Replayed score', score, 'matches' if ok else 'DIFFERS')
+        return
+
+    env = reader.environment() if args.verify else None
+    games = 0
+    steps = 0
+    mismatches = 0
+    best = None
+    start = time.perf_counter()
+    for _, trace in reader.games(actions=args.verify):
+        games += 1
+        steps += trace.steps
+        if best is None or trace.score > best.score:
+            best = trace
+        if env is not None:
+            _, ok = replay(env, trace)
+            if not ok:
+                mismatches += 1
+                print('Game', trace.game, 'does not replay to score', trace.score)
+    seconds = time.perf_counter() - start
+    print('Board {}x{} Games {} Steps {} Bytes {}'.format(reader.width, reader.height, games, steps,
+                                                          os.path.getsize(args.file)))
+    if best is not None:
+        print('Best game', best.game, 'Score', best.score, 'Steps', best.steps)
+    if env is not None:
+        print('Replayed', games, 'games,', mismatches, 'mismatches, Steps/sec', round(steps / seconds))
+
+
+if __name__ == '__main__':
+    main()
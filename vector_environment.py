@@ -0,0 +1,166 @@
+import numpy as np
+from observation import RIGHT, DELTA_X, DELTA_Y, STATE_SIZE, encode_states, is_collision_batch, encode_grids, grid_shape
+
+# [straight, right, left] -> change of the clockwise direction index
+TURN = np.array([0, 1, -1], dtype=np.int64)
+
+START_LENGTH = 3
+FOOD_TRIES = 8
+
+
+# N independent snake games stepped in lock-step, with the same rules as Environment.
+# Board state lives in NumPy arrays: an occupancy grid per game, the body as a ring buffer of
+# flat cell indices, and head, direction and food arrays. Finished games are reset automatically.
+# States are the 11 features, or with observation='grid' the board planes of observation.encode_grids.
+class VectorEnvironment:
+    def __init__(self, n_envs, window_width=640, window_height=480, cell_size=20, seed=None, observation='features'):
+        self.n_envs = n_envs
+        self.fieldW = window_width//cell_size
+        self.fieldH = window_height//cell_size
+        self.n_cells = self.fieldW * self.fieldH
+        self.rng = np.random.default_rng(seed)
+        self.idx = np.arange(n_envs)
+
+        self.grid = np.zeros((n_envs, self.fieldH, self.fieldW), dtype=np.uint8)
+        self.body = np.zeros((n_envs, self.n_cells), dtype=np.int32)  # ring buffer of y * fieldW + x
+        self.head_ptr = np.zeros(n_envs, dtype=np.int64)
+        self.length = np.zeros(n_envs, dtype=np.int64)
+        self.head_x = np.zeros(n_envs, dtype=np.int64)
+        self.head_y = np.zeros(n_envs, dtype=np.int64)
+        self.direction = np.zeros(n_envs, dtype=np.int64)
+        self.food_x = np.zeros(n_envs, dtype=np.int64)
+        self.food_y = np.zeros(n_envs, dtype=np.int64)
+        self.score = np.zeros(n_envs, dtype=np.int64)
+        self.frame_iteration = np.zeros(n_envs, dtype=np.int64)
+
+        # score of the games that ended in the last step, valid where done is set
+        self.final_score = np.zeros(n_envs, dtype=np.int64)
+
+        self.observation = observation
+        if observation == 'grid':
+            # step at which each body cell was entered, for the body age plane
+            self.stamps = np.zeros((n_envs, self.fieldH, self.fieldW), dtype=np.int64)
+            self.clock = np.zeros(n_envs, dtype=np.int64)
+            self.states = np.zeros((n_envs,) + grid_shape(self.fieldW, self.fieldH), dtype=np.uint8)
+        elif observation == 'features':
+            self.states = np.zeros((n_envs, STATE_SIZE), dtype=np.uint8)
+        else:
+            raise ValueError('unknown observation {!r}, expected features or grid'.format(observation))
+
+        self.reset()
+
+    def reset(self, mask=None):
+        if mask is None:
+            mask = np.ones(self.n_envs, dtype=bool)
+        envs = self.idx[mask]
+        if len(envs) == 0:
+            return self.get_states()
+
+        self.grid[envs] = 0
+        x = self.fieldW // 2
+        y = self.fieldH // 2
+        for i in range(START_LENGTH):
+            # tail first, so the head ends up at head_ptr
+            self.body[envs, i] = y * self.fieldW + x - (START_LENGTH - 1 - i)
+            self.grid[envs, y, x - i] = 1
+        self.head_ptr[envs] = START_LENGTH - 1
+        self.length[envs] = START_LENGTH
+        self.head_x[envs] = x
+        self.head_y[envs] = y
+        self.direction[envs] = RIGHT
+        self.food_x[envs] = x + 1
+        self.food_y[envs] = y + 1
+        self.score[envs] = 0
+        self.frame_iteration[envs] = 0
+        if self.observation == 'grid':
+            self.stamps[envs] = 0
+            for i in range(START_LENGTH):
+                self.stamps[envs, y, x - i] = START_LENGTH - i
+            self.clock[envs] = START_LENGTH
+
+        return self.get_states()
+
+    def step(self, actions):
+        actions = np.asarray(actions)
+        if actions.ndim == 2:
+            actions = actions.argmax(axis=1)  # one-hot [straight, right, left]
+
+        self.frame_iteration += 1
+
+        # 1. move
+        self.direction = (self.direction + TURN[actions]) % 4
+        x = self.head_x + DELTA_X[self.direction]
+        y = self.head_y + DELTA_Y[self.direction]
+
+        # 2. check if game over, the tail has not moved yet so it still counts as body
+        dones = self.is_collision(x, y)
+        dones |= self.frame_iteration > 100 * (self.length + 1)
+        alive = self.idx[~dones]
+
+        # 3. advance the alive snakes
+        self.head_x[alive] = x[alive]
+        self.head_y[alive] = y[alive]
+        self.head_ptr[alive] = (self.head_ptr[alive] + 1) % self.n_cells
+        self.body[alive, self.head_ptr[alive]] = y[alive] * self.fieldW + x[alive]
+        self.grid[alive, y[alive], x[alive]] = 1
+        self.length[alive] += 1
+        if self.observation == 'grid':
+            self.clock[alive] += 1
+            self.stamps[alive, y[alive], x[alive]] = self.clock[alive]
+
+        # 4. place new food or just move
+        ate = ~dones & (x == self.food_x) & (y == self.food_y)
+        moved = self.idx[~dones & ~ate]
+        tail = self.body[moved, (self.head_ptr[moved] - self.length[moved] + 1) % self.n_cells]
+        self.grid[moved, tail // self.fieldW, tail % self.fieldW] = 0
+        if self.observation == 'grid':
+            self.stamps[moved, tail // self.fieldW, tail % self.fieldW] = 0
+        self.length[moved] -= 1
+
+        self.score[ate] += 1
+        dones |= ~self.place_food(ate)
+
+        rewards = np.zeros(self.n_envs, dtype=np.int64)
+        rewards[ate] = 10
+        rewards[dones] = -10
+
+        # 5. restart finished games, their returned state is the first state of the new game
+        self.final_score[dones] = self.score[dones]
+        self.reset(dones)
+
+        return self.get_states(), rewards, dones
+
+    def is_collision(self, x, y):
+        return is_collision_batch(self.grid, x, y)
+
+    def place_food(self, mask):
+        # rejection sampling on the grid, with an exact fallback for crowded boards
+        envs = self.idx[mask]
+        placed = np.ones(self.n_envs, dtype=bool)
+        for _ in range(FOOD_TRIES):
+            if len(envs) == 0:
+                return placed
+            cells = self.rng.integers(0, self.n_cells, size=len(envs))
+            fx = cells % self.fieldW
+            fy = cells // self.fieldW
+            free = self.grid[envs, fy, fx] == 0
+            self.food_x[envs[free]] = fx[free]
+            self.food_y[envs[free]] = fy[free]
+            envs = envs[~free]
+
+        for env in envs:
+            cells = np.flatnonzero(self.grid[env] == 0)
+            if len(cells) == 0:
+                placed[env] = False  # board is full
+                continue
+            cell = self.rng.choice(cells)
+            self.food_x[env] = cell % self.fieldW
+            self.food_y[env] = cell // self.fieldW
+        return placed
+
+    def get_states(self):
+        if self.observation == 'grid':
+            encode_grids(self.stamps, self.clock, self.head_x, self.head_y, self.food_x, self.food_y, self.states)
+            return self.states.copy()
+        encode_states(self.grid, self.head_x, self.head_y, self.direction, self.food_x, self.food_y, self.states)
+        return self.states.copy()